@@ -1,4 +1,4 @@
-import redis
+import redis.asyncio as redis
 from redis.exceptions import RedisError
 import json
 import logging
@@ -44,6 +44,10 @@ class JobStatusResponse(BaseModel):
 
 redis_pool = redis.ConnectionPool(host="redis", port=6379, db=0, max_connections=10)
 
+# Jobs are Redis hashes (job:<id>) with one JSON-encoded value per field, so
+# each update writes only the fields it changes
+JOB_TTL_SECONDS = 7200
+
 
 def get_redis_client():
     try:
@@ -53,6 +57,35 @@ def get_redis_client():
         raise HTTPException(status_code=500, detail="Database connection error")
 
 
+async def update_job(redis_client, job_id, **fields):
+    """Set the given fields of a job hash and refresh its expiry."""
+
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hset(
+            f"job:{job_id}",
+            mapping={name: json.dumps(value) for name, value in fields.items()},
+        )
+        pipe.expire(f"job:{job_id}", JOB_TTL_SECONDS)
+        await pipe.execute()
+
+
+async def load_job(redis_client, job_id, *fields):
+    """Return the given fields of a job (None when unset), or None if it does not exist."""
+
+    if not await redis_client.exists(f"job:{job_id}"):
+        return None
+
+    values = await redis_client.hmget(f"job:{job_id}", fields)
+    return {
+        name: json.loads(value) if value is not None else None
+        for name, value in zip(fields, values)
+    }
+
+
+def now():
+    return datetime.datetime.now(datetime.UTC).isoformat()
+
+
 def get_memory_usage():
     process = psutil.Process()
     return process.memory_info().rss / 1024 / 1024
@@ -64,14 +97,14 @@ async def start_crawl(request: CrawlRequest):
     job_id = str(uuid.uuid4())
     redis_client = get_redis_client()
 
-    job_data = {
-        "status": "queued",
-        "error": None,
-        "created_at": datetime.datetime.now(datetime.UTC).isoformat(),
-        "crawl_request": request.model_dump(),  # Use model_dump instead of dict
-    }
-
-    redis_client.set(f"job:{job_id}", json.dumps(job_data), ex=7200)
+    await update_job(
+        redis_client,
+        job_id,
+        status="queued",
+        error=None,
+        created_at=now(),
+        crawl_request=request.model_dump(),  # Use model_dump instead of dict
+    )
 
     asyncio.create_task(run_crawl(job_id, request))
 
@@ -83,13 +116,12 @@ async def start_crawl(request: CrawlRequest):
 async def get_status(job_id: str):
 
     redis_client = get_redis_client()
-    job_data_str = redis_client.get(f"job:{job_id}")
+    job_data = await load_job(redis_client, job_id, "status", "error")
 
-    if not job_data_str:
+    if job_data is None:
         logger.error(f"Job {job_id} not found")
         raise HTTPException(status_code=404, detail="Job not found")
 
-    job_data = json.loads(job_data_str)
     logger.info(f"Job {job_id} status: {job_data['status']}")
 
     return JobStatusResponse(
@@ -105,21 +137,16 @@ async def heartbeat(job_id):
             redis_client = get_redis_client()
 
             current_memory = get_memory_usage()
-            job_data_str = redis_client.get(f"job:{job_id}")
 
-            if job_data_str:
-
-                job_data = json.loads(job_data_str)
-
-                job_data["last_heartbeat"] = datetime.datetime.now(
-                    datetime.UTC
-                ).isoformat()
-                job_data["memory_usage_mb"] = current_memory
-
-                redis_client.set(f"job:{job_id}", json.dumps(job_data), ex=7200)
-                logger.debug(
-                    f"Heartbeat for job {job_id}: Memory usage {current_memory:.2f}MB"
-                )
+            await update_job(
+                redis_client,
+                job_id,
+                last_heartbeat=now(),
+                memory_usage_mb=current_memory,
+            )
+            logger.debug(
+                f"Heartbeat for job {job_id}: Memory usage {current_memory:.2f}MB"
+            )
 
         except Exception as e:
 
@@ -135,13 +162,7 @@ async def run_crawl(job_id: str, request: CrawlRequest):
 
         redis_client = get_redis_client()
 
-        job_data_str = redis_client.get(f"job:{job_id}")
-        job_data = json.loads(job_data_str)
-
-        job_data["status"] = "running"
-        job_data["started_at"] = datetime.datetime.now(datetime.UTC).isoformat()
-
-        redis_client.set(f"job:{job_id}", json.dumps(job_data), ex=7200)
+        await update_job(redis_client, job_id, status="running", started_at=now())
 
         logger.info(f"Starting crawl job {job_id} with params: {request.model_dump()}")
 
@@ -249,42 +270,45 @@ async def run_crawl(job_id: str, request: CrawlRequest):
             except Exception as e:
                 logger.error(f"Error checking MongoDB: {str(e)}")
 
-            job_data_str = redis_client.get(f"job:{job_id}")
-            job_data = json.loads(job_data_str)
-
             if exit_code == 0:
                 logger.info(f"Crawl job {job_id} completed successfully")
-                job_data["status"] = "completed"
+                await update_job(
+                    redis_client, job_id, status="completed", finished_at=now()
+                )
             else:
                 logger.error(f"Crawl job {job_id} failed with exit code {exit_code}")
-                job_data["status"] = "failed"
-                job_data["error"] = f"Process exited with code {exit_code}"
-
-            job_data["finished_at"] = datetime.datetime.now(datetime.UTC).isoformat()
-            redis_client.set(f"job:{job_id}", json.dumps(job_data), ex=7200)
+                await update_job(
+                    redis_client,
+                    job_id,
+                    status="failed",
+                    error=f"Process exited with code {exit_code}",
+                    finished_at=now(),
+                )
 
         except asyncio.TimeoutError:
             # Kill the process if it times out
             logger.error(f"Crawl job {job_id} timed out after {max_runtime} seconds")
             process.kill()
 
-            job_data_str = redis_client.get(f"job:{job_id}")
-            job_data = json.loads(job_data_str)
-            job_data["status"] = "failed"
-            job_data["error"] = f"Job timed out after {max_runtime} seconds"
-            job_data["finished_at"] = datetime.datetime.now(datetime.UTC).isoformat()
-            redis_client.set(f"job:{job_id}", json.dumps(job_data), ex=7200)
+            await update_job(
+                redis_client,
+                job_id,
+                status="failed",
+                error=f"Job timed out after {max_runtime} seconds",
+                finished_at=now(),
+            )
 
     except Exception as e:
         logger.exception(f"Error in crawl job {job_id}: {str(e)}")
 
         try:
-            job_data_str = redis_client.get(f"job:{job_id}")
-            job_data = json.loads(job_data_str)
-            job_data["status"] = "failed"
-            job_data["error"] = str(e)
-            job_data["finished_at"] = datetime.datetime.now(datetime.UTC).isoformat()
-            redis_client.set(f"job:{job_id}", json.dumps(job_data), ex=7200)
+            await update_job(
+                redis_client,
+                job_id,
+                status="failed",
+                error=str(e),
+                finished_at=now(),
+            )
         except Exception as redis_error:
             logger.error(f"Failed to update Redis after error: {str(redis_error)}")
     finally:
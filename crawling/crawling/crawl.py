@@ -53,6 +53,17 @@ def main():
     parser.add_argument(
         "--spider-name", type=str, default="wikipedia_spider", help="Name of the spider"
     )
+    parser.add_argument(
+        "--full-recrawl",
+        action="store_true",
+        help="Download stored pages unconditionally instead of with If-None-Match/If-Modified-Since",
+    )
+    parser.add_argument(
+        "--compress-fields",
+        type=str,
+        default="",
+        help="Comma-separated item fields to store zstd-compressed, e.g. content,infobox,internal_links",
+    )
 
     args = parser.parse_args()
 
@@ -65,6 +76,10 @@ def main():
     settings.set("MONGODB_COLLECTION", args.mongo_collection)
     settings.set("DEPTH_LIMIT", args.depth_limit)
     settings.set("CLOSESPIDER_PAGECOUNT", args.page_limit)
+    if args.full_recrawl:
+        settings.set("CONDITIONAL_REQUESTS_ENABLED", False)
+    if args.compress_fields:
+        settings.set("MONGODB_COMPRESS_FIELDS", args.compress_fields.split(","))
 
     print("MONGODB settings:")
 
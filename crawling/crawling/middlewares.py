@@ -3,7 +3,18 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import logging
+from collections import OrderedDict
+
+import pymongo
 from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet import defer, reactor, threads
+
+from crawling.pipelines import decompress_value
+
+logger = logging.getLogger(__name__)
 
 
 class CrawlingSpiderMiddleware:
@@ -98,3 +109,185 @@ class CrawlingDownloaderMiddleware:
 
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+
+
+class HttpValidatorsSpiderMiddleware:
+    """
+    Copies the ETag and Last-Modified headers of a page onto the items scraped
+    from it, so the pipeline stores them for ConditionalRequestMiddleware.
+    """
+
+    def process_spider_output(self, response, result, spider):
+        for item in result:
+            yield self.add_validators(response, item)
+
+    async def process_spider_output_async(self, response, result, spider):
+        async for item in result:
+            yield self.add_validators(response, item)
+
+    def add_validators(self, response, item):
+        if isinstance(item, dict) and item.get("url") == response.url:
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            if etag:
+                item["http_etag"] = etag.decode("latin-1")
+            if last_modified:
+                item["http_last_modified"] = last_modified.decode("latin-1")
+        return item
+
+
+class ConditionalRequestMiddleware:
+    """
+    Recrawls pages already in MONGODB_COLLECTION with If-None-Match and
+    If-Modified-Since built from their stored validators, and drops the
+    304 Not Modified answers: the stored copy is current.
+
+    Validators are looked up on a thread, one $in query for all the requests
+    scheduled together, and kept in an LRU cache of
+    CONDITIONAL_REQUESTS_CACHE_SIZE urls.
+
+    Spiders with a follow_stored_links(response) method get the 304 answers
+    with the page's stored internal_links in response.meta["stored_links"],
+    so a refresh crawl still reaches changed pages behind unchanged ones. For
+    other spiders 304 answers are dropped. Disable with
+    CONDITIONAL_REQUESTS_ENABLED = False for a full recrawl.
+    """
+
+    def __init__(self, mongo_uri, mongo_db, collection_name, stats, cache_size=10000):
+        self.mongo_uri = mongo_uri
+        self.mongo_db = mongo_db
+        self.collection_name = collection_name
+        self.stats = stats
+        self.cache_size = cache_size
+        self.client = None
+        # url -> (etag, last_modified), or None for pages that are not stored
+        self.cache = OrderedDict()
+        # url -> Deferreds waiting for the next lookup
+        self.pending = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool("CONDITIONAL_REQUESTS_ENABLED", True):
+            raise NotConfigured
+
+        s = cls(
+            mongo_uri=crawler.settings.get("MONGODB_URI", "mongodb://localhost:27017"),
+            mongo_db=crawler.settings.get("MONGODB_DATABASE", "wikipedia_db"),
+            collection_name=crawler.settings.get("MONGODB_COLLECTION", "articles"),
+            stats=crawler.stats,
+            cache_size=crawler.settings.getint(
+                "CONDITIONAL_REQUESTS_CACHE_SIZE", 10000
+            ),
+        )
+        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        return s
+
+    def spider_opened(self, spider):
+        # Connects lazily, on the first lookup
+        self.client = pymongo.MongoClient(self.mongo_uri)
+
+    def spider_closed(self, spider):
+        self.client.close()
+
+    def lookup(self, url):
+        """Deferred firing with the stored validators of url, or None."""
+
+        if url in self.cache:
+            self.cache.move_to_end(url)
+            return defer.succeed(self.cache[url])
+
+        waiter = defer.Deferred()
+        if not self.pending:
+            # Collect the other requests scheduled in this reactor turn
+            reactor.callLater(0, self.flush)
+        self.pending.setdefault(url, []).append(waiter)
+        return waiter
+
+    def flush(self):
+        pending, self.pending = self.pending, {}
+
+        def found(validators):
+            for url, waiters in pending.items():
+                self.remember(url, validators.get(url))
+                for waiter in waiters:
+                    waiter.callback(validators.get(url))
+
+        def failed(failure):
+            logger.warning(f"Could not look up stored validators: {failure.value}")
+            for waiters in pending.values():
+                for waiter in waiters:
+                    waiter.callback(None)
+
+        deferred = threads.deferToThread(self.fetch_validators, list(pending))
+        deferred.addCallbacks(found, failed)
+
+    def fetch_validators(self, urls):
+        """url -> (etag, last_modified) for the stored urls. Runs on a thread."""
+
+        cursor = self.client[self.mongo_db][self.collection_name].find(
+            {"url": {"$in": urls}},
+            {"_id": 0, "url": 1, "http_etag": 1, "http_last_modified": 1},
+        )
+        return {
+            doc["url"]: (doc.get("http_etag"), doc.get("http_last_modified"))
+            for doc in cursor
+            if doc.get("http_etag") or doc.get("http_last_modified")
+        }
+
+    def remember(self, url, validators):
+        self.cache[url] = validators
+        self.cache.move_to_end(url)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    async def process_request(self, request, spider):
+        validators = await maybe_deferred_to_future(self.lookup(request.url))
+        if not validators:
+            return None
+
+        etag, last_modified = validators
+        if etag:
+            request.headers.setdefault("If-None-Match", etag)
+        if last_modified:
+            request.headers.setdefault("If-Modified-Since", last_modified)
+        request.meta["conditional"] = True
+        if hasattr(spider, "follow_stored_links"):
+            # Let HttpErrorMiddleware pass 304 answers on to the callback
+            request.meta["handle_httpstatus_list"] = [
+                *request.meta.get(
+                    "handle_httpstatus_list",
+                    getattr(spider, "handle_httpstatus_list", []),
+                ),
+                304,
+            ]
+        self.stats.inc_value("conditional_requests/sent", spider=spider)
+        return None
+
+    async def process_response(self, request, response, spider):
+        if response.status != 304 or not request.meta.get("conditional"):
+            return response
+
+        self.stats.inc_value("conditional_requests/not_modified", spider=spider)
+        if not hasattr(spider, "follow_stored_links"):
+            raise IgnoreRequest(f"Not modified since last crawl: {request.url}")
+
+        try:
+            request.meta["stored_links"] = await maybe_deferred_to_future(
+                threads.deferToThread(self.fetch_links, request.url)
+            )
+        except Exception as e:
+            logger.warning(f"Could not load the stored links of {request.url}: {e}")
+            request.meta["stored_links"] = []
+        return response
+
+    def fetch_links(self, url):
+        """Urls of the stored internal_links of url. Runs on a thread."""
+
+        doc = self.client[self.mongo_db][self.collection_name].find_one(
+            {"url": url}, {"_id": 0, "internal_links": 1}
+        )
+        links = decompress_value((doc or {}).get("internal_links")) or []
+        return [
+            link["url"] for link in links if isinstance(link, dict) and "url" in link
+        ]
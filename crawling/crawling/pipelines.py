@@ -1,19 +1,218 @@
+import hashlib
+import json
+
 import pymongo
-from scrapy.exceptions import DropItem
+from bson.binary import Binary
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from twisted.internet import reactor, task, threads
 from itemadapter import ItemAdapter
+from collections import defaultdict
 from datetime import datetime
+import functools
 import logging
+import queue
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compressed fields are stored as BSON binary holding a zstd frame of the
+# UTF-8 text (strings) or of the JSON encoding (lists and dicts) of the value.
+# The indexer's sources.decompress_value reads both back.
+COMPRESSED_TEXT_SUBTYPE = 0x80
+COMPRESSED_JSON_SUBTYPE = 0x81
+
+
+FINGERPRINT_FIELD = "content_fingerprint"
+# Set by Mongo when a changed page is written; the indexer's incremental
+# high-water mark. crawl_time is stamped at parse time, before the page is
+# buffered and queued, so it can be older than pages already indexed.
+STORED_AT_FIELD = "stored_at"
+HTTP_VALIDATOR_FIELDS = ("http_etag", "http_last_modified")
+# Fields that differ between crawls of an unchanged page
+VOLATILE_FIELDS = ("_id", "crawl_time", FINGERPRINT_FIELD) + HTTP_VALIDATOR_FIELDS
+
+
+def content_fingerprint(document):
+    """SHA-256 of the document's content, ignoring VOLATILE_FIELDS."""
+
+    content = {
+        key: value for key, value in document.items() if key not in VOLATILE_FIELDS
+    }
+    encoded = json.dumps(content, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def compress_value(value, compressor, min_bytes):
+    """value as compressed BSON binary, or unchanged if it is too small to bother."""
+
+    if isinstance(value, str):
+        data, subtype = value.encode("utf-8"), COMPRESSED_TEXT_SUBTYPE
+    elif isinstance(value, (list, dict)):
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        subtype = COMPRESSED_JSON_SUBTYPE
+    else:
+        return value
+
+    if len(data) < min_bytes:
+        return value
+    return Binary(compressor.compress(data), subtype)
+
+
+def decompress_value(value):
+    """A value stored by compress_value, decoded. Other values are returned as is."""
+
+    if not isinstance(value, Binary) or value.subtype not in (
+        COMPRESSED_TEXT_SUBTYPE,
+        COMPRESSED_JSON_SUBTYPE,
+    ):
+        return value
+    if zstandard is None:
+        raise RuntimeError("Stored value is zstd-compressed, install zstandard")
+
+    data = zstandard.decompress(bytes(value))
+    if value.subtype == COMPRESSED_TEXT_SUBTYPE:
+        return data.decode("utf-8")
+    return json.loads(data)
+
+
+class MongoWriter:
+    """
+    Runs Mongo writes on a dedicated thread so slow writes never stall the
+    reactor. When max_pending writes are waiting the crawler engine is paused,
+    and it is resumed once the writer has worked the queue down to half that.
+    """
+
+    def __init__(self, crawler, max_pending=10, name="mongo-writer"):
+        self.crawler = crawler
+        self.max_pending = max_pending
+        self.resume_below = max_pending // 2
+        self.queue = queue.Queue()
+        self.paused = False
+        self.logger = logging.getLogger(__name__)
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
 
+    def submit(self, write, *args, **kwargs):
+        """Queue write(*args, **kwargs); called from the reactor thread."""
 
-class MongoDBPipeline:
+        self.queue.put(functools.partial(write, *args, **kwargs))
+
+        if not self.paused and self.queue.qsize() >= self.max_pending:
+            self.logger.info(
+                f"{self.queue.qsize()} Mongo writes pending, pausing the crawler"
+            )
+            self.paused = True
+            self.crawler.engine.pause()
+            # The writer may have drained the queue before paused was set, in
+            # which case it never schedules resume()
+            self.resume()
+
+    def resume(self):
+        if self.paused and self.queue.qsize() <= self.resume_below:
+            self.logger.info("Mongo writer caught up, resuming the crawler")
+            self.paused = False
+            self.crawler.engine.unpause()
+
+    def run(self):
+        while True:
+            write = self.queue.get()
+            if write is None:
+                break
+
+            try:
+                write()
+            except Exception as e:
+                self.logger.error(f"Mongo write failed: {e}", exc_info=True)
+
+            # paused is only flipped on the reactor thread, which rechecks it
+            if self.paused and self.queue.qsize() <= self.resume_below:
+                reactor.callFromThread(self.resume)
+
+    def close(self):
+        """Finish the queued writes and stop the thread. Blocks until done."""
+
+        self.queue.put(None)
+        self.thread.join()
+
+
+def bulk_write(collection, requests, logger):
+    """
+    Apply requests to collection in one unordered bulk_write, logging instead
+    of raising on errors. Returns the BulkWriteResult, or None if it failed.
+    """
+
+    try:
+        return collection.bulk_write(requests, ordered=False)
+    except BulkWriteError as e:
+        # Unordered: every other request in the batch was still applied.
+        # Duplicate keys come from concurrent upserts of the same key.
+        errors = e.details.get("writeErrors", [])
+        duplicates = sum(1 for error in errors if error.get("code") == 11000)
+        logger.warning(
+            f"Bulk write to {collection.name}: {len(errors)} of {len(requests)} "
+            f"writes failed ({duplicates} duplicate keys)"
+        )
+        for error in errors:
+            if error.get("code") != 11000:
+                logger.error(f"Write error: {error.get('errmsg')}")
+    except pymongo.errors.PyMongoError as e:
+        logger.error(
+            f"Bulk write of {len(requests)} writes to {collection.name} failed: {e}"
+        )
+    return None
 
-    def __init__(self, mongo_uri, mongo_db, collection_name):
+
+class MongoDBPipeline:
+    """
+    Upserts items by url. Items are buffered and written as one unordered
+    bulk_write once MONGODB_BULK_SIZE are pending, every
+    MONGODB_FLUSH_SECONDS and when the spider closes. The writes run on a
+    MongoWriter thread, with at most MONGODB_MAX_PENDING_WRITES batches queued.
+
+    Fields listed in MONGODB_COMPRESS_FIELDS are stored zstd-compressed (see
+    compress_value) when they are at least MONGODB_COMPRESS_MIN_BYTES long.
+
+    Each document is stored with its content_fingerprint. A recrawled page
+    whose fingerprint matches the stored one is not rewritten (stored_at
+    stays put, so incremental indexing skips it); only changed HTTP
+    validators are updated. Written documents get stored_at set to the
+    server's time of the write.
+    """
+
+    def __init__(
+        self,
+        mongo_uri,
+        mongo_db,
+        collection_name,
+        bulk_size=500,
+        flush_seconds=5.0,
+        max_pending_writes=10,
+        compress_fields=(),
+        compress_min_bytes=1024,
+        compress_level=3,
+    ):
 
         self.mongo_uri = mongo_uri
         self.mongo_db = mongo_db
         self.collection_name = collection_name
+        self.bulk_size = bulk_size
+        self.flush_seconds = flush_seconds
+        self.max_pending_writes = max_pending_writes
+        self.compress_fields = list(compress_fields)
+        self.compress_min_bytes = compress_min_bytes
+        self.compress_level = compress_level
+        self.compressor = None
         self.client = None
+        self.writer = None
         self.db = None
+        # url -> pending document; a page seen twice before a flush is written once
+        self.buffer = {}
+        self.flush_loop = None
+        self.logger = logging.getLogger(__name__)
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -21,44 +220,174 @@ class MongoDBPipeline:
             mongo_uri=crawler.settings.get("MONGODB_URI", "mongodb://localhost:27017"),
             mongo_db=crawler.settings.get("MONGODB_DATABASE", "wikipedia_db"),
             collection_name=crawler.settings.get("MONGODB_COLLECTION", "articles"),
+            bulk_size=crawler.settings.getint("MONGODB_BULK_SIZE", 500),
+            flush_seconds=crawler.settings.getfloat("MONGODB_FLUSH_SECONDS", 5.0),
+            max_pending_writes=crawler.settings.getint(
+                "MONGODB_MAX_PENDING_WRITES", 10
+            ),
+            compress_fields=crawler.settings.getlist("MONGODB_COMPRESS_FIELDS"),
+            compress_min_bytes=crawler.settings.getint(
+                "MONGODB_COMPRESS_MIN_BYTES", 1024
+            ),
+            compress_level=crawler.settings.getint("MONGODB_COMPRESS_LEVEL", 3),
         )
 
     def open_spider(self, spider):
 
+        if self.compress_fields:
+            if zstandard is None:
+                self.logger.warning(
+                    "MONGODB_COMPRESS_FIELDS is set but zstandard is not installed, "
+                    "storing all fields uncompressed"
+                )
+                self.compress_fields = []
+            else:
+                # Only used from the writer thread
+                self.compressor = zstandard.ZstdCompressor(level=self.compress_level)
+
         self.client = pymongo.MongoClient(self.mongo_uri)
         self.db = self.client[self.mongo_db]
         self.db[self.collection_name].create_index("url", unique=True)
+        self.writer = MongoWriter(spider.crawler, self.max_pending_writes)
+
+        if self.flush_seconds > 0:
+            self.flush_loop = task.LoopingCall(self.flush)
+            self.flush_loop.start(self.flush_seconds, now=False)
 
     def close_spider(self, spider):
-        self.client.close()  # type: ignore
+        if self.flush_loop and self.flush_loop.running:
+            self.flush_loop.stop()
+        self.flush()
+
+        # The spider only finishes closing once every queued write is done
+        deferred = threads.deferToThread(self.writer.close)  # type: ignore
+        deferred.addBoth(lambda result: self.client.close())  # type: ignore
+        return deferred
 
     def process_item(self, item, spider):
 
         adapter = ItemAdapter(item)
+        url = adapter["url"]
 
-        print(f"MongoDBPipeline.process_item: Processing {adapter['url']}")
+        self.buffer[url] = dict(adapter)
+        self.logger.debug(f"Buffered {url} ({len(self.buffer)} pending)")
 
-        try:
+        if len(self.buffer) >= self.bulk_size:
+            self.flush()
+
+        return item
+
+    def flush(self):
+        """Hand the buffered documents to the writer as one batch."""
+
+        if not self.buffer:
+            return
+
+        documents = list(self.buffer.values())
+        self.buffer = {}
+        self.writer.submit(self.write_batch, documents)  # type: ignore
+
+    def write_batch(self, documents):
+        """Upsert changed documents in one unordered bulk_write. Runs on the writer thread."""
 
-            self.db[self.collection_name].update_one(  # type: ignore
-                {"url": adapter["url"]},  # Query for finding the document
-                {"$set": dict(adapter)},  # Update with new data
-                upsert=True,  # Insert if not exists
+        stored = self.stored_versions([document["url"] for document in documents])
+
+        requests = []
+        unchanged = 0
+        for document in documents:
+            document[FINGERPRINT_FIELD] = content_fingerprint(document)
+            previous = stored.get(document["url"])
+
+            if (
+                previous
+                and previous.get(FINGERPRINT_FIELD) == document[FINGERPRINT_FIELD]
+            ):
+                unchanged += 1
+                validators = {
+                    field: document[field]
+                    for field in HTTP_VALIDATOR_FIELDS
+                    if field in document and document[field] != previous.get(field)
+                }
+                if validators:
+                    requests.append(
+                        UpdateOne({"url": document["url"]}, {"$set": validators})
+                    )
+                continue
+
+            requests.append(
+                UpdateOne(
+                    {"url": document["url"]},
+                    {
+                        "$set": self.compress_document(document),
+                        "$currentDate": {STORED_AT_FIELD: True},
+                    },
+                    upsert=True,
+                )
             )
 
-        except pymongo.errors.DuplicateKeyError:
-            raise DropItem(f"Duplicate item found: {item['url']}")
+        if unchanged:
+            self.logger.info(f"Skipped {unchanged} unchanged pages")
+        if not requests:
+            return
 
-        print("Item successfully processed by MongoDB pipeline")
-        return item
+        result = bulk_write(
+            self.db[self.collection_name], requests, self.logger  # type: ignore
+        )
+        if result:
+            self.logger.info(
+                f"Wrote {len(requests)} items to {self.collection_name}: "
+                f"{result.upserted_count} new, {result.modified_count} updated"
+            )
 
+    def stored_versions(self, urls):
+        """url -> stored fingerprint and HTTP validators, for the urls already stored."""
 
-class DotabuffMongoPipeline:
-    """Pipeline to store Dotabuff data in MongoDB with proper structure"""
+        projection = {"_id": 0, "url": 1, FINGERPRINT_FIELD: 1}
+        projection.update({field: 1 for field in HTTP_VALIDATOR_FIELDS})
+        try:
+            cursor = self.db[self.collection_name].find(  # type: ignore
+                {"url": {"$in": urls}}, projection
+            )
+            return {doc["url"]: doc for doc in cursor}
+        except pymongo.errors.PyMongoError as e:
+            # Without the stored versions every document is written
+            self.logger.warning(f"Could not look up stored fingerprints: {e}")
+            return {}
+
+    def compress_document(self, document):
+        for field in self.compress_fields:
+            if field in document:
+                document[field] = compress_value(
+                    document[field], self.compressor, self.compress_min_bytes
+                )
+        return document
 
-    def __init__(self, mongo_uri, mongo_db):
+
+class DotabuffMongoPipeline:
+    """
+    Pipeline to store Dotabuff data in MongoDB with proper structure.
+
+    Matches and their pick/win counters are collected in memory and written
+    per flush (MONGODB_BULK_SIZE matches, MONGODB_FLUSH_SECONDS or spider
+    close) as one bulk_write per collection.
+    """
+
+    def __init__(
+        self,
+        mongo_uri,
+        mongo_db,
+        bulk_size=500,
+        flush_seconds=5.0,
+        max_pending_writes=10,
+    ):
         self.mongo_uri = mongo_uri
         self.mongo_db = mongo_db
+        self.bulk_size = bulk_size
+        self.flush_seconds = flush_seconds
+        self.max_pending_writes = max_pending_writes
+        self.writer = None
+        self.flush_loop = None
+        self.reset_buffers()
         self.logger = logging.getLogger(__name__)
 
     @classmethod
@@ -66,6 +395,11 @@ class DotabuffMongoPipeline:
         return cls(
             mongo_uri=crawler.settings.getlist("MONGODB_URI")[0],
             mongo_db=crawler.settings.get("MONGODB_DATABASE", "dotabuff"),
+            bulk_size=crawler.settings.getint("MONGODB_BULK_SIZE", 500),
+            flush_seconds=crawler.settings.getfloat("MONGODB_FLUSH_SECONDS", 5.0),
+            max_pending_writes=crawler.settings.getint(
+                "MONGODB_MAX_PENDING_WRITES", 10
+            ),
         )
 
     def open_spider(self, spider):
@@ -76,9 +410,23 @@ class DotabuffMongoPipeline:
         # Create indexes for better query performance
         self.create_indexes()
 
+        self.writer = MongoWriter(
+            spider.crawler, self.max_pending_writes, name="dotabuff-writer"
+        )
+
+        if self.flush_seconds > 0:
+            self.flush_loop = task.LoopingCall(self.flush)
+            self.flush_loop.start(self.flush_seconds, now=False)
+
     def close_spider(self, spider):
-        """Close MongoDB connection"""
-        self.client.close()
+        """Flush and finish the queued writes, then close the MongoDB connection"""
+        if self.flush_loop and self.flush_loop.running:
+            self.flush_loop.stop()
+        self.flush()
+
+        deferred = threads.deferToThread(self.writer.close)
+        deferred.addBoth(lambda result: self.client.close())
+        return deferred
 
     def create_indexes(self):
         """Create indexes for efficient querying"""
@@ -147,14 +495,17 @@ class DotabuffMongoPipeline:
             },
         }
 
-        # Upsert match data
-        self.db.matches.update_one(
+        # Upsert match data, keeping the latest copy of a match seen twice
+        self.match_buffer[match_data["match_id"]] = UpdateOne(
             {"match_id": match_data["match_id"]}, {"$set": match_data}, upsert=True
         )
 
-        # Update match statistics collection
+        # Update match statistics counters
         self.update_match_statistics(match_data)
 
+        if len(self.match_buffer) >= self.bulk_size:
+            self.flush()
+
     def process_hero(self, item):
         """Process and store hero data"""
         hero_data = {
@@ -177,8 +528,11 @@ class DotabuffMongoPipeline:
         }
 
         # Upsert hero data
-        self.db.heroes.update_one(
-            {"hero_name": hero_data["hero_name"]}, {"$set": hero_data}, upsert=True
+        self.writer.submit(
+            self.db.heroes.update_one,
+            {"hero_name": hero_data["hero_name"]},
+            {"$set": hero_data},
+            upsert=True,
         )
 
     def process_hero_matchups(self, item):
@@ -191,10 +545,11 @@ class DotabuffMongoPipeline:
         }
 
         # Store in separate collection for historical tracking
-        self.db.hero_matchups.insert_one(matchup_data)
+        self.writer.submit(self.db.hero_matchups.insert_one, matchup_data)
 
         # Also update the main heroes collection with latest matchup data
-        self.db.heroes.update_one(
+        self.writer.submit(
+            self.db.heroes.update_one,
             {"hero_name": item["hero_name"]},
             {
                 "$set": {
@@ -246,43 +601,69 @@ class DotabuffMongoPipeline:
         # For now, returning basic structure
         return composition
 
+    def reset_buffers(self):
+        self.match_buffer = {}
+        self.hero_counters = defaultdict(lambda: {"picks": 0, "wins": 0})
+        self.hero_last_seen = {}
+        self.global_counters = defaultdict(int)
+
     def update_match_statistics(self, match_data):
-        """Update aggregated statistics collection"""
-        stats_update = {"total_matches": 1, "last_updated": datetime.utcnow()}
+        """Add a match to the pending pick/win counters"""
+        self.global_counters["total_matches"] += 1
 
         # Update win counters
         if match_data.get("winner"):
-            stats_update[f"{match_data['winner']}_wins"] = 1
+            self.global_counters[f"{match_data['winner']}_wins"] += 1
 
         # Update hero pick statistics
-        all_heroes = match_data["radiant_heroes"] + match_data["dire_heroes"]
-        for hero in all_heroes:
-            self.db.hero_stats.update_one(
+        seen_at = datetime.utcnow()
+        for team in ("radiant", "dire"):
+            won = match_data["winner"] == team
+            for hero in match_data[f"{team}_heroes"]:
+                self.hero_counters[hero]["picks"] += 1
+                self.hero_counters[hero]["wins"] += int(won)
+                self.hero_last_seen[hero] = seen_at
+
+    def flush(self):
+        """Hand the buffered matches and counters to the writer as one batch"""
+        if not self.match_buffer:
+            return
+
+        match_requests = list(self.match_buffer.values())
+        hero_requests = [
+            UpdateOne(
                 {"hero_name": hero},
+                {"$inc": counters, "$set": {"last_seen": self.hero_last_seen[hero]}},
+                upsert=True,
+            )
+            for hero, counters in self.hero_counters.items()
+        ]
+        global_counters = dict(self.global_counters)
+        self.reset_buffers()
+
+        self.writer.submit(
+            self.write_matches, match_requests, hero_requests, global_counters
+        )
+
+    def write_matches(self, match_requests, hero_requests, global_counters):
+        """Write a flushed batch, one request per collection. Runs on the writer thread"""
+        bulk_write(self.db.matches, match_requests, self.logger)
+        if hero_requests:
+            bulk_write(self.db.hero_stats, hero_requests, self.logger)
+
+        # Update global statistics
+        try:
+            self.db.statistics.update_one(
+                {"_id": "global"},
                 {
-                    "$inc": {
-                        "picks": 1,
-                        "wins": (
-                            1
-                            if (
-                                (
-                                    hero in match_data["radiant_heroes"]
-                                    and match_data["winner"] == "radiant"
-                                )
-                                or (
-                                    hero in match_data["dire_heroes"]
-                                    and match_data["winner"] == "dire"
-                                )
-                            )
-                            else 0
-                        ),
-                    },
-                    "$set": {"last_seen": datetime.utcnow()},
+                    "$inc": global_counters,
+                    "$set": {"last_updated": datetime.utcnow()},
                 },
                 upsert=True,
             )
+        except pymongo.errors.PyMongoError as e:
+            self.logger.error(f"Updating global statistics failed: {e}")
 
-        # Update global statistics
-        self.db.statistics.update_one(
-            {"_id": "global"}, {"$inc": stats_update}, upsert=True
+        self.logger.info(
+            f"Wrote {len(match_requests)} matches and stats for {len(hero_requests)} heroes"
         )
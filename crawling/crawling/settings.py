@@ -21,6 +21,28 @@ ITEM_PIPELINES = {
 MONGODB_URI = "mongodb://localhost:27017"
 MONGODB_DATABASE = "wikipedia_db"
 MONGODB_COLLECTION = "ww2_articles"
+# Items are upserted in unordered batches of MONGODB_BULK_SIZE, flushed at
+# least every MONGODB_FLUSH_SECONDS
+MONGODB_BULK_SIZE = 500
+MONGODB_FLUSH_SECONDS = 5.0
+# Writes run on a background thread; the crawler pauses while this many are queued
+MONGODB_MAX_PENDING_WRITES = 10
+# Store these fields zstd-compressed when they are at least
+# MONGODB_COMPRESS_MIN_BYTES long (needs zstandard; the indexer decompresses)
+MONGODB_COMPRESS_FIELDS = []
+MONGODB_COMPRESS_MIN_BYTES = 1024
+MONGODB_COMPRESS_LEVEL = 3
+
+# Store each page's ETag/Last-Modified and recrawl stored pages conditionally
+SPIDER_MIDDLEWARES = {
+    "crawling.middlewares.HttpValidatorsSpiderMiddleware": 545,
+}
+DOWNLOADER_MIDDLEWARES = {
+    "crawling.middlewares.ConditionalRequestMiddleware": 580,
+}
+CONDITIONAL_REQUESTS_ENABLED = True
+# Stored validators are looked up per batch of requests and cached for this many urls
+CONDITIONAL_REQUESTS_CACHE_SIZE = 10000
 
 LOG_LEVEL = "DEBUG"
 
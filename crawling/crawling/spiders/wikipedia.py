@@ -1,3 +1,4 @@
+import scrapy
 from scrapy.linkextractors import LinkExtractor
 from scrapy.spiders import CrawlSpider, Rule
 import re
@@ -36,9 +37,38 @@ class WikipediaSpider(CrawlSpider):
     def limit_links_per_page(self, links):
         return links[:300]
 
+    def parse_start_url(self, response):
+        # Links followed out of unchanged pages come through here, so the
+        # rules are applied to them like to any other crawled page
+        if response.meta.get("stored_link"):
+            return self.parse_article(response)
+        # An unchanged seed has no body for the rules to extract links from
+        if response.status == 304:
+            return self.follow_stored_links(response)
+        return []
+
+    def follow_stored_links(self, response):
+        """
+        Requests for the stored links of a page that has not changed since
+        the last crawl (304), filtered like the article rule filters links.
+        """
+
+        link_extractor = self.rules[0].link_extractor
+        urls = [
+            url
+            for url in response.meta.get("stored_links", [])
+            if link_extractor.matches(url)
+        ]
+        for url in self.limit_links_per_page(urls):
+            yield scrapy.Request(url, meta={"stored_link": True})
+
     def parse_article(self, response):
         """Extract content from a Wikipedia article."""
 
+        if response.status == 304:
+            yield from self.follow_stored_links(response)
+            return
+
         title = response.css("h1#firstHeading::text").get()
         content_paragraphs = response.css("div.mw-parser-output p")
 
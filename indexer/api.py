@@ -1,23 +1,167 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 import asyncio
-import redis
+import os
+import redis.asyncio as redis
 from redis.exceptions import RedisError
+import argparse
 import uuid
-from typing import Optional
+from collections import deque
+from typing import List, Optional
 import logging
 import datetime
 import json
+import threading
+import time
 import psutil
+import pymongo
+from concurrent.futures import ThreadPoolExecutor
+from elasticsearch import Elasticsearch
+
+import mongo_to_elastic
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
 redis_pool = redis.ConnectionPool(host="redis", port=6379, db=0, max_connections=10)
 
+# Jobs are Redis hashes (job:<id>) with one JSON-encoded value per field, so
+# each update writes only the fields it changes
+JOB_TTL_SECONDS = 7200
+
+# Long-lived clients shared by every job; both are thread-safe and pooled.
+# Like the job executor and logging, they are set up on startup: shard
+# processes are spawned and re-import this module, and must not create them.
+mongo_client = None
+es_client = None
+
+# At most this many jobs run at once across all indexer replicas, the rest
+# wait in the Redis queue
+MAX_CONCURRENT_JOBS = int(os.environ.get("INDEXER_MAX_JOBS", "2"))
+
+# Sorted set of queued job ids, see enqueue_job for the ordering
+JOB_QUEUE_KEY = "index_jobs:queue"
+
+# Sorted set of running job ids scored by the expiry of their lease. A
+# running job holds one of the MAX_CONCURRENT_JOBS slots; its heartbeat
+# renews the lease, so the slots of a crashed replica free up on their own.
+RUNNING_JOBS_KEY = "index_jobs:running"
+JOB_LEASE_SECONDS = 90
+
+# Start the first queued job if a slot is free, atomically across replicas.
+# KEYS: queue, running set; ARGV: now, lease expiry, slot count
+CLAIM_JOB_SCRIPT = """
+redis.call("ZREMRANGEBYSCORE", KEYS[2], "-inf", ARGV[1])
+if redis.call("ZCARD", KEYS[2]) >= tonumber(ARGV[3]) then
+    return false
+end
+local popped = redis.call("ZPOPMIN", KEYS[1])
+if #popped == 0 then
+    return false
+end
+redis.call("ZADD", KEYS[2], ARGV[2], popped[1])
+return popped[1]
+"""
+
+# Hash of checkpoint id -> the job last started on it. A checkpoint is only
+# resumed when that job is neither queued nor holding a live lease.
+CHECKPOINT_OWNERS_KEY = "index_jobs:checkpoint_owners"
+
+# Queue job ARGV[3] on checkpoint ARGV[1] unless the checkpoint's owner
+# (ARGV[2] if none was recorded) is queued or running; returns that owner.
+# KEYS: owners hash, queue, running set; ARGV: checkpoint id, default owner,
+# job id, now, queue score
+QUEUE_ON_CHECKPOINT_SCRIPT = """
+local owner = redis.call("HGET", KEYS[1], ARGV[1]) or ARGV[2]
+if redis.call("ZSCORE", KEYS[2], owner) then
+    return owner
+end
+local lease = redis.call("ZSCORE", KEYS[3], owner)
+if lease and tonumber(lease) > tonumber(ARGV[4]) then
+    return owner
+end
+redis.call("HSET", KEYS[1], ARGV[1], ARGV[3])
+redis.call("ZADD", KEYS[2], ARGV[5], ARGV[3])
+return false
+"""
+
+# How often a running job's owner renews its lease and checks for a cancel
+# request, and how often it stores memory usage and the log tail
+HEARTBEAT_SECONDS = 5
+HEARTBEAT_DETAILS_SECONDS = 30
+
+# Indexing jobs run in-process on these threads instead of in a subprocess
+job_executor = None
+
+# Jobs running in this process, mapped to the event that cancels them. Other
+# replicas cancel them through the job's cancel_requested field.
+running_jobs = {}
+
+# Set whenever a job is queued or finishes so the scheduler looks again
+scheduler_wakeup = asyncio.Event()
+
+# Recent log lines kept per job, and size caps for what is stored in Redis
+JOB_LOG_LINES = int(os.environ.get("INDEXER_JOB_LOG_LINES", "200"))
+MAX_LOG_LINE_CHARS = 1000
+MAX_ERROR_CHARS = 4000
+
+
+class JobLogHandler(logging.Handler):
+    """
+    Keeps the last JOB_LOG_LINES log lines of each running job in a ring
+    buffer. Records are matched to jobs by thread name: a job runs on a thread
+    named job-<id>, and its bulk workers' names start with that.
+    """
+
+    def __init__(self, max_lines):
+        super().__init__()
+        self.max_lines = max_lines
+        self.buffers = {}
+        self.error_counts = {}
+
+    def start(self, job_id):
+        self.buffers[f"job-{job_id}"] = deque(maxlen=self.max_lines)
+        self.error_counts[f"job-{job_id}"] = 0
+
+    def stop(self, job_id):
+        self.buffers.pop(f"job-{job_id}", None)
+        self.error_counts.pop(f"job-{job_id}", None)
+
+    def tail(self, job_id):
+        # emit() appends under the same lock from the job's threads
+        with self.lock:
+            return list(self.buffers.get(f"job-{job_id}", ()))
+
+    def error_count(self, job_id):
+        return self.error_counts.get(f"job-{job_id}", 0)
+
+    def emit(self, record):
+        key = record.threadName.split("/")[0]
+        buffer = self.buffers.get(key)
+        if buffer is None:
+            return
+
+        try:
+            line = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+
+        buffer.append(truncate(line, MAX_LOG_LINE_CHARS))
+        if record.levelno >= logging.ERROR:
+            self.error_counts[key] += 1
+
+
+def truncate(text, limit):
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... ({len(text) - limit} more characters)"
+
+
+job_logs = JobLogHandler(JOB_LOG_LINES)
+job_logs.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+
 
 def get_redis_client():
     try:
@@ -27,17 +171,60 @@ def get_redis_client():
         raise HTTPException(status_code=500, detail="Database connection error")
 
 
+async def update_job(redis_client, job_id, **fields):
+    """Set the given fields of a job hash and refresh its expiry."""
+
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.hset(
+            f"job:{job_id}",
+            mapping={name: json.dumps(value) for name, value in fields.items()},
+        )
+        pipe.expire(f"job:{job_id}", JOB_TTL_SECONDS)
+        await pipe.execute()
+
+
+async def load_job(redis_client, job_id, *fields):
+    """Return the given fields of a job (None when unset), or None if it does not exist."""
+
+    if not await redis_client.exists(f"job:{job_id}"):
+        return None
+
+    values = await redis_client.hmget(f"job:{job_id}", fields)
+    return {
+        name: json.loads(value) if value is not None else None
+        for name, value in zip(fields, values)
+    }
+
+
+def now():
+    return datetime.datetime.now(datetime.UTC).isoformat()
+
+
 class IndexRequest(BaseModel):
     mongo_db: str
     mongo_collection: str
     elastic_index: str
     batch_size: int
+    source: str = mongo_to_elastic.DEFAULT_SOURCE
+    passages: bool = False
+    workers: int = 1
+    shards: int = 1
+    bulk_load: bool = False
+    force_merge: bool = False
+    incremental: bool = False
+    reindex: bool = False
+    retry_dead_letters: bool = False
+    # Higher priorities are started first, FIFO within a priority
+    priority: int = 0
 
 
 class JobStatusResponse(BaseModel):
     job_id: str
-    status: str  # "queued", "running", "completed", "failed"
+    status: str  # "queued", "running", "cancelling", "cancelled", "completed", "failed"
     error: Optional[str] = None
+    progress: Optional[dict] = None
+    error_count: Optional[int] = None
+    log_tail: Optional[List[str]] = None
 
 
 @app.post("/index", response_model=JobStatusResponse)
@@ -46,37 +233,220 @@ async def start_indexer(request: IndexRequest):
     start indexer job, return json response immediately
     """
 
+    if request.source not in mongo_to_elastic.SOURCES:
+        raise HTTPException(status_code=422, detail=f"Unknown source {request.source}")
+
     job_id = str(uuid.uuid4())
+    await enqueue_job(
+        job_id, build_indexer_args(job_id, request), priority=request.priority
+    )
+
+    return JobStatusResponse(job_id=job_id, status="queued")
+
+
+@app.post("/resume/{job_id}", response_model=JobStatusResponse)
+async def resume_indexer(job_id: str):
+    """
+    start a new job that continues a crashed or failed job from its checkpoint
+    """
+
     redis_client = get_redis_client()
 
-    job_data = {
-        "status": "queued",
-        "error": None,
-        "created_at": datetime.datetime.now(datetime.UTC).isoformat(),
-    }
+    # Resumed jobs keep writing under the checkpoint of the job they resumed;
+    # jobs whose data expired are assumed to use their own id
+    job_data = await load_job(redis_client, job_id, "args")
+    checkpoint_id = job_id
+    if job_data and job_data["args"] and job_data["args"].get("checkpoint_id"):
+        checkpoint_id = job_data["args"]["checkpoint_id"]
+
+    checkpoints = mongo_client[mongo_to_elastic.CHECKPOINT_DB][
+        mongo_to_elastic.CHECKPOINT_COLLECTION
+    ]
+    checkpoint = await asyncio.get_running_loop().run_in_executor(
+        None, checkpoints.find_one, {"_id": checkpoint_id}
+    )
 
-    redis_client.set(f"job:{job_id}", json.dumps(job_data), ex=7200)
-    asyncio.create_task(run_indexer(job_id, request))
+    if not checkpoint or "args" not in checkpoint:
+        logger.error(f"No checkpoint {checkpoint_id} found for job {job_id}")
+        raise HTTPException(status_code=404, detail="Checkpoint not found")
 
-    return JobStatusResponse(job_id=job_id, status="queued")
+    if checkpoint.get("status") == "completed":
+        raise HTTPException(status_code=409, detail="Job already completed")
+
+    # Options added since the checkpoint was written keep their defaults
+    defaults = vars(mongo_to_elastic.build_parser().parse_args([]))
+    args = argparse.Namespace(**{**defaults, **checkpoint["args"]})
+    args.resume = True
+
+    if args.reindex or args.retry_dead_letters:
+        raise HTTPException(
+            status_code=422,
+            detail="Reindex and dead-letter retry jobs cannot be resumed, start a new job",
+        )
+
+    new_job_id = str(uuid.uuid4())
+    await enqueue_job(
+        new_job_id, args, checkpoint_id=checkpoint_id, resumed_from=job_id
+    )
+
+    return JobStatusResponse(job_id=new_job_id, status="queued")
+
+
+@app.post("/cancel/{job_id}", response_model=JobStatusResponse)
+async def cancel_indexer(job_id: str):
+    """
+    cancel a queued job, or ask a running one to stop after its current batches
+    """
+
+    redis_client = get_redis_client()
+    job_data = await load_job(redis_client, job_id, "status")
+
+    if job_data is None:
+        logger.error(f"Job {job_id} not found")
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    if await redis_client.zrem(JOB_QUEUE_KEY, job_id):
+        status = "cancelled"
+        await update_job(redis_client, job_id, status=status, finished_at=now())
+    elif job_data["status"] in ("queued", "running", "cancelling"):
+        # Running, or claimed and about to start, possibly on another
+        # replica: its owner's heartbeat picks the request up
+        status = "cancelling"
+        await update_job(redis_client, job_id, status=status, cancel_requested=True)
+        if job_id in running_jobs:
+            running_jobs[job_id].set()
+    else:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Job is {job_data['status']}, not queued or running",
+        )
+
+    logger.info(f"Job {job_id} {status}")
+
+    return JobStatusResponse(job_id=job_id, status=status)
 
 
 @app.get("/status/{job_id}", response_model=JobStatusResponse)
 async def get_status(job_id: str):
 
     redis_client = get_redis_client()
-    job_data_str = redis_client.get(f"job:{job_id}")
+    job_data = await load_job(
+        redis_client, job_id, "status", "error", "progress", "error_count", "log_tail"
+    )
 
-    if not job_data_str:
+    if job_data is None:
         logger.error(f"Job {job_id} not found")
         raise HTTPException(status_code=404, detail="Job not found")
 
-    job_data = json.loads(job_data_str)
     logger.info(f"Job {job_id} status: {job_data['status']}")
 
-    return JobStatusResponse(
-        job_id=job_id, status=job_data["status"], error=job_data["error"]
+    return JobStatusResponse(job_id=job_id, **job_data)
+
+
+async def enqueue_job(job_id, args, priority=0, checkpoint_id=None, **fields):
+    """
+    Persist a job and its arguments in Redis and add it to the queue. A job
+    resuming checkpoint_id is refused (409) while another job on it is queued
+    or running.
+    """
+
+    redis_client = get_redis_client()
+
+    await update_job(
+        redis_client,
+        job_id,
+        status="queued",
+        error=None,
+        created_at=now(),
+        priority=priority,
+        args=vars(args),
+        **fields,
     )
+    # Lowest score is popped first: higher priority, then older job
+    score = -priority * 1e13 + time.time() * 1000
+
+    if checkpoint_id is None:
+        await redis_client.zadd(JOB_QUEUE_KEY, {job_id: score})
+    else:
+        queue_on_checkpoint = redis_client.register_script(QUEUE_ON_CHECKPOINT_SCRIPT)
+        owner = await queue_on_checkpoint(
+            keys=[CHECKPOINT_OWNERS_KEY, JOB_QUEUE_KEY, RUNNING_JOBS_KEY],
+            args=[checkpoint_id, checkpoint_id, job_id, time.time(), score],
+        )
+        if owner:
+            await redis_client.delete(f"job:{job_id}")
+            raise HTTPException(
+                status_code=409,
+                detail=f"Job {owner.decode()} is still queued or running on this checkpoint",
+            )
+
+    scheduler_wakeup.set()
+
+
+async def schedule_jobs():
+    """
+    Start queued jobs while fewer than MAX_CONCURRENT_JOBS run on all
+    replicas together. The queue and the running set live in Redis, so jobs
+    queued before a restart are picked up again.
+    """
+
+    while True:
+        scheduler_wakeup.clear()
+
+        try:
+            redis_client = get_redis_client()
+            claim_job = redis_client.register_script(CLAIM_JOB_SCRIPT)
+
+            while True:
+                started = time.time()
+                claimed = await claim_job(
+                    keys=[JOB_QUEUE_KEY, RUNNING_JOBS_KEY],
+                    args=[started, started + JOB_LEASE_SECONDS, MAX_CONCURRENT_JOBS],
+                )
+                if not claimed:
+                    break
+
+                job_id = claimed.decode()
+                job_data = await load_job(redis_client, job_id, "args")
+                if job_data is None:
+                    logger.warning(f"Dropping queued job {job_id}, its data expired")
+                    await redis_client.zrem(RUNNING_JOBS_KEY, job_id)
+                    continue
+
+                args = argparse.Namespace(**job_data["args"])
+                running_jobs[job_id] = threading.Event()
+                asyncio.create_task(run_indexer(job_id, args))
+
+        except Exception as e:
+            logger.error(f"Error scheduling index jobs: {str(e)}")
+
+        try:
+            await asyncio.wait_for(scheduler_wakeup.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            pass
+
+
+@app.on_event("startup")
+async def start_scheduler():
+    global mongo_client, es_client, job_executor
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger().addHandler(job_logs)
+
+    mongo_client = pymongo.MongoClient(
+        os.environ.get("MONGODB_URI", "mongodb://localhost:27017")
+    )
+    es_client = Elasticsearch(
+        os.environ.get("ELASTICSEARCH_URI", "http://localhost:9200"),
+        serializers=mongo_to_elastic.client_serializers(),
+        request_timeout=30,
+    )
+    job_executor = ThreadPoolExecutor(
+        max_workers=MAX_CONCURRENT_JOBS,
+        thread_name_prefix="index-job",
+    )
+
+    asyncio.create_task(schedule_jobs())
 
 
 def get_memory_usage():
@@ -85,29 +455,113 @@ def get_memory_usage():
 
 
 async def heartbeat(job_id):
+    """
+    Renew the job's slot lease and pass on cancel requests made through any
+    replica; store memory usage and the log tail less often.
+    """
 
     redis_client = get_redis_client()
+    last_details = 0.0
 
     while True:
         try:
-            current_memory = get_memory_usage()
-            job_data_str = redis_client.get(f"job:{job_id}")
-            if job_data_str:
-                job_data = json.loads(job_data_str)
-                job_data["last_heartbeat"] = datetime.datetime.now(
-                    datetime.UTC
-                ).isoformat()
-                job_data["memory_usage_mb"] = current_memory
-                redis_client.set(f"job:{job_id}", json.dumps(job_data), ex=7200)
+            await redis_client.zadd(
+                RUNNING_JOBS_KEY, {job_id: time.time() + JOB_LEASE_SECONDS}, xx=True
+            )
+
+            job_data = await load_job(redis_client, job_id, "cancel_requested")
+            if job_data and job_data["cancel_requested"]:
+                running_jobs[job_id].set()
+
+            if time.monotonic() - last_details >= HEARTBEAT_DETAILS_SECONDS:
+                last_details = time.monotonic()
+                current_memory = get_memory_usage()
+                await update_job(
+                    redis_client,
+                    job_id,
+                    last_heartbeat=now(),
+                    memory_usage_mb=current_memory,
+                    log_tail=job_logs.tail(job_id),
+                    error_count=job_logs.error_count(job_id),
+                )
                 logger.debug(
                     f"Heartbeat for job {job_id}: Memory usage {current_memory:.2f}MB"
                 )
         except Exception as e:
             logger.error(f"Error in heartbeat for job {job_id}: {str(e)}")
-        await asyncio.sleep(30)
+        await asyncio.sleep(HEARTBEAT_SECONDS)
+
+
+def publish_progress(job_id, loop):
+    """
+    Return a callback that stores indexer progress snapshots on the job. It is
+    called from the job's thread and hands the write to the event loop.
+    """
+
+    redis_client = get_redis_client()
+
+    def on_progress(snapshot):
+        asyncio.run_coroutine_threadsafe(
+            update_job(redis_client, job_id, progress=snapshot), loop
+        )
+
+    return on_progress
 
 
-async def run_indexer(job_id: str, request: IndexRequest):
+def run_job_thread(job_id, args, on_progress, cancel_event):
+    """Run a job on an executor thread renamed so its logs reach job_logs."""
+
+    thread = threading.current_thread()
+    previous_name = thread.name
+    thread.name = f"job-{job_id}"
+
+    try:
+        return mongo_to_elastic.run_indexing(
+            args, mongo_client, es_client, on_progress, cancel_event
+        )
+    finally:
+        thread.name = previous_name
+
+
+def build_indexer_args(job_id: str, request: IndexRequest):
+    """Translate an IndexRequest into mongo_to_elastic command line arguments."""
+
+    argv = [
+        "--checkpoint-id",
+        job_id,
+        "--mongo-db",
+        request.mongo_db,
+        "--mongo-collection",
+        request.mongo_collection,
+        "--elastic-index",
+        request.elastic_index,
+        "--batch-size",
+        str(request.batch_size),
+        "--source",
+        request.source,
+        "--workers",
+        str(request.workers),
+        "--shards",
+        str(request.shards),
+    ]
+
+    if request.passages:
+        argv.append("--passages")
+    if request.bulk_load:
+        argv.append("--bulk-load")
+    if request.force_merge:
+        argv.append("--force-merge")
+    if request.incremental:
+        argv.append("--incremental")
+    if request.reindex:
+        argv.append("--reindex")
+    if request.retry_dead_letters:
+        argv.append("--retry-dead-letters")
+
+    return mongo_to_elastic.build_parser().parse_args(argv)
+
+
+async def run_indexer(job_id: str, args: argparse.Namespace):
 
     heartbeat_task = None
 
@@ -115,63 +569,68 @@ async def run_indexer(job_id: str, request: IndexRequest):
 
         redis_client = get_redis_client()
 
-        job_data_str = redis_client.get(f"job:{job_id}")
-        job_data = json.loads(job_data_str)
-
-        job_data["status"] = "running"
-        job_data["started_at"] = datetime.datetime.now(datetime.UTC).isoformat()
+        job_data = await load_job(redis_client, job_id, "cancel_requested")
+        if job_data and job_data["cancel_requested"]:
+            # Cancelled between being claimed and starting
+            raise mongo_to_elastic.JobCancelled()
 
-        redis_client.set(f"job:{job_id}", json.dumps(job_data), ex=7200)
+        await update_job(redis_client, job_id, status="running", started_at=now())
 
-        logger.info(f"Starting crawl job {job_id} with params: {request.model_dump()}")
+        logger.info(f"Starting index job {job_id} with params: {vars(args)}")
 
+        job_logs.start(job_id)
         heartbeat_task = asyncio.create_task(heartbeat(job_id))
 
-        cmd = [
-            "bash",
-            "-c",
-            f"cd /app/indexer && python mongo_to_elastic.py --mongo-db {request.mongo_db} --mongo-collection {request.mongo_collection} --elastic-index {request.elastic_index} --batch-size {request.batch_size}",
-        ]
-
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
+        loop = asyncio.get_running_loop()
+        progress = await loop.run_in_executor(
+            job_executor,
+            run_job_thread,
+            job_id,
+            args,
+            publish_progress(job_id, loop),
+            running_jobs[job_id],
         )
 
-        stdout, stderr = await process.communicate()
-        stdout_text = stdout.decode()
-        stderr_text = stderr.decode()
+        logger.info(
+            f"Index job {job_id} completed successfully: {progress.successful} successful, {progress.failed} failed"
+        )
 
-        logger.info(f"Indexer stdout: {stdout_text}")
-        if stderr_text:
-            logger.warning(f"Indexer stderr: {stderr_text}")
+        await update_job(
+            redis_client,
+            job_id,
+            status="completed",
+            finished_at=now(),
+            log_tail=job_logs.tail(job_id),
+            error_count=job_logs.error_count(job_id),
+        )
 
-        job_data_str = redis_client.get(f"job:{job_id}")
-        job_data = json.loads(job_data_str)
+    except mongo_to_elastic.JobCancelled:
 
-        if process.returncode == 0:
-            logger.info(f"Index job {job_id} completed successfully")
-            job_data["status"] = "completed"
-        else:
-            logger.error(f"Index job {job_id} failed: {stderr_text}")
-            job_data["status"] = "failed"
-            job_data["error"] = stderr_text
+        logger.info(f"Index job {job_id} cancelled")
 
-        job_data["finished_at"] = datetime.datetime.now(datetime.UTC).isoformat()
-        redis_client.set(f"job:{job_id}", json.dumps(job_data), ex=7200)
+        await update_job(
+            redis_client,
+            job_id,
+            status="cancelled",
+            finished_at=now(),
+            log_tail=job_logs.tail(job_id),
+            error_count=job_logs.error_count(job_id),
+        )
 
     except Exception as e:
 
         logger.exception(f"Error in crawl job {job_id}: {str(e)}")
 
         try:
-            job_data_str = redis_client.get(f"job:{job_id}")
-            job_data = json.loads(job_data_str)
-            job_data["status"] = "failed"
-            job_data["error"] = str(e)
-            job_data["finished_at"] = datetime.datetime.now(datetime.UTC).isoformat()
-            redis_client.set(f"job:{job_id}", json.dumps(job_data), ex=7200)
+            await update_job(
+                redis_client,
+                job_id,
+                status="failed",
+                error=truncate(f"{type(e).__name__}: {e}", MAX_ERROR_CHARS),
+                finished_at=now(),
+                log_tail=job_logs.tail(job_id),
+                error_count=job_logs.error_count(job_id),
+            )
 
         except Exception as redis_error:
             logger.error(f"Failed to update Redis after error: {str(redis_error)}")
@@ -185,6 +644,15 @@ async def run_indexer(job_id: str, request: IndexRequest):
             except asyncio.CancelledError:
                 pass
 
+        try:
+            await get_redis_client().zrem(RUNNING_JOBS_KEY, job_id)
+        except Exception as e:
+            logger.error(f"Failed to release the slot of job {job_id}: {str(e)}")
+
+        running_jobs.pop(job_id, None)
+        job_logs.stop(job_id)
+        scheduler_wakeup.set()
+
 
 @app.get("/health")
 async def health_check():
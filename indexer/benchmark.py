@@ -0,0 +1,422 @@
+# search-engine/indexer/benchmark.py
+#
+# Throughput benchmark for the Mongo -> Elasticsearch indexing pipeline.
+#
+# Runs process_in_batches against an in-memory collection filled with
+# synthetic Wikipedia-shaped articles and a local stub of the Elasticsearch
+# bulk API, so it needs neither a database nor a cluster:
+#
+#     python benchmark.py --docs 20000 --workers 4
+#
+# Reports docs/sec, peak RSS and the time spent reading, transforming,
+# serializing and sending. Use --output to keep the numbers as JSON and
+# compare them between commits, and --stdlib-json to compare the orjson
+# bulk encoder against the standard library one. --compress stores the large
+# fields zstd-compressed the way the crawler's MONGODB_COMPRESS_FIELDS mode
+# does, to compare collection size and read throughput against plain storage.
+
+import argparse
+import bisect
+import json
+import logging
+import random
+import resource
+import string
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import bson
+from bson import Binary, ObjectId
+from elasticsearch import Elasticsearch
+from elasticsearch.serializer import JsonSerializer
+
+import mongo_to_elastic
+from mongo_to_elastic import AdaptiveBatcher, process_in_batches
+from sources import COMPRESSED_JSON_SUBTYPE, COMPRESSED_TEXT_SUBTYPE
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# The fields the crawler is told to compress (MONGODB_COMPRESS_FIELDS)
+COMPRESS_FIELDS = ("content", "infobox", "internal_links")
+COMPRESS_MIN_BYTES = 1024
+
+_words_rng = random.Random(0)
+WORDS = [
+    "".join(_words_rng.choices(string.ascii_lowercase, k=_words_rng.randint(3, 10)))
+    for _ in range(5000)
+]
+
+
+def generate_article(rng, content_kb):
+    """Build one document shaped like the Wikipedia spider's output."""
+
+    title = " ".join(rng.choices(WORDS, k=rng.randint(1, 4))).title()
+    # Article sizes are long-tailed: most are short, a few are huge
+    size = int(content_kb * 1024 * rng.lognormvariate(0, 1))
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    content = " ".join(words)
+
+    return {
+        "url": f"https://en.wikipedia.org/wiki/{title.replace(' ', '_')}",
+        "title": title,
+        "summary": content[:500],
+        "content": content,
+        "categories": [
+            " ".join(rng.choices(WORDS, k=2)).title() for _ in range(rng.randint(1, 8))
+        ],
+        "infobox": {
+            rng.choice(WORDS): rng.choice(WORDS) for _ in range(rng.randint(0, 10))
+        },
+        "internal_links": [
+            {
+                "url": f"https://en.wikipedia.org/wiki/{rng.choice(WORDS).title()}",
+                "text": rng.choice(WORDS),
+            }
+            for _ in range(rng.randint(10, 300))
+        ],
+        "last_modified": "1 January 2025",
+        "crawl_time": f"2025-01-01T00:00:{rng.randint(0, 59):02d}",
+    }
+
+
+def compress_article(article, compressor):
+    """Store COMPRESS_FIELDS like the crawler's compressed storage mode."""
+
+    for field in COMPRESS_FIELDS:
+        value = article.get(field)
+        if isinstance(value, str):
+            data, subtype = value.encode("utf-8"), COMPRESSED_TEXT_SUBTYPE
+        else:
+            data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+            subtype = COMPRESSED_JSON_SUBTYPE
+        if len(data) >= COMPRESS_MIN_BYTES:
+            article[field] = Binary(compressor.compress(data), subtype)
+
+
+class InMemoryCursor:
+    def __init__(self, docs, projection):
+        # BSON-encoded documents, decoded on iteration as the driver would
+        self.docs = docs
+        self.projection = projection
+
+    def sort(self, key, direction):
+        # Documents are already kept in _id order
+        return self
+
+    def limit(self, count):
+        self.docs = self.docs[:count]
+        return self
+
+    def __iter__(self):
+        for raw in self.docs:
+            doc = bson.decode(raw)
+            if self.projection:
+                yield {
+                    key: value
+                    for key, value in doc.items()
+                    if key == "_id" or key in self.projection
+                }
+            else:
+                yield doc
+
+
+class InMemoryCollection:
+    """
+    Just enough of a pymongo collection for iter_mongo_batches.
+
+    Only supports the queries a full reindex issues (no filter, or _id $gt),
+    so the read stage measures the indexer rather than a Mongo emulation.
+    """
+
+    def __init__(self, docs):
+        docs = sorted(docs, key=lambda doc: doc["_id"])
+        self.docs = [bson.encode(doc) for doc in docs]
+        self.ids = [doc["_id"] for doc in docs]
+        self.size_bytes = sum(len(raw) for raw in self.docs)
+
+    def count_documents(self, query):
+        return len(self.docs)
+
+    def find(self, query=None, projection=None):
+        start = 0
+        if query:
+            start = bisect.bisect_right(self.ids, query["_id"]["$gt"])
+        return InMemoryCursor(self.docs[start:], projection)
+
+
+def build_collection(docs, content_kb, seed, compress=False):
+    """Fill an in-memory collection with synthetic articles."""
+
+    rng = random.Random(seed)
+    compressor = zstandard.ZstdCompressor(level=3) if compress else None
+    articles = []
+    for _ in range(docs):
+        article = generate_article(rng, content_kb)
+        article["_id"] = ObjectId()
+        if compressor:
+            compress_article(article, compressor)
+        articles.append(article)
+
+    return InMemoryCollection(articles)
+
+
+class TimingSerializer(JsonSerializer):
+    """JSON serializer that records the time spent in dumps()."""
+
+    def __init__(self):
+        super().__init__()
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def dumps(self, data):
+        started = time.perf_counter()
+        result = super().dumps(data)
+        with self._lock:
+            self.seconds += time.perf_counter() - started
+        return result
+
+
+class TimedFunction:
+    """Wraps function, recording the time spent in it."""
+
+    def __init__(self, function):
+        self.function = function
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        started = time.perf_counter()
+        result = self.function(*args, **kwargs)
+        with self._lock:
+            self.seconds += time.perf_counter() - started
+        return result
+
+
+class StubBulkHandler(BaseHTTPRequestHandler):
+    """Answers the Elasticsearch endpoints the indexer calls, acking every action."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("X-Elastic-Product", "Elasticsearch")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_GET(self):
+        self.read_body()
+        self.send_json({"version": {"number": "8.18.1"}, "tagline": "stub"})
+
+    def do_POST(self):
+        body = self.read_body()
+        path = self.path.split("?")[0]
+
+        if path.endswith("/_bulk"):
+            items = []
+            for line in body.splitlines()[::2]:
+                op_type, meta = next(iter(json.loads(line).items()))
+                items.append({op_type: {"_id": meta.get("_id"), "status": 201}})
+            self.server.bulk_requests += 1
+            self.server.bulk_bytes += len(body)
+            self.send_json({"took": 1, "errors": False, "items": items})
+        elif path.endswith("/_mget"):
+            ids = json.loads(body).get("ids", [])
+            self.send_json(
+                {"docs": [{"_id": doc_id, "found": False} for doc_id in ids]}
+            )
+        else:
+            self.send_json({"acknowledged": True})
+
+    do_PUT = do_POST
+
+
+class StubElasticsearch:
+    """Local HTTP server standing in for an Elasticsearch cluster."""
+
+    def __enter__(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubBulkHandler)
+        self.server.bulk_requests = 0
+        self.server.bulk_bytes = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_benchmark(args):
+    logger.info(
+        f"Generating {args.docs} synthetic articles (~{args.content_kb} KB content)..."
+    )
+    collection = build_collection(
+        args.docs, args.content_kb, args.seed, compress=args.compress
+    )
+    rss_before = peak_rss_mb()
+
+    with StubElasticsearch() as stub:
+        serializer = TimingSerializer()
+        # build_action encodes each document once more to hash it
+        hashing = TimedFunction(mongo_to_elastic.content_hash)
+        mongo_to_elastic.content_hash = hashing
+        es_client = Elasticsearch(
+            stub.url, serializers={"application/json": serializer}, request_timeout=30
+        )
+
+        started = time.perf_counter()
+        progress = process_in_batches(
+            collection,
+            es_client,
+            "benchmark",
+            batch_size=args.batch_size,
+            workers=args.workers,
+            skip_unchanged=args.skip_unchanged,
+            batcher=AdaptiveBatcher(target_bytes=args.bulk_bytes),
+        )
+        elapsed = time.perf_counter() - started
+        mongo_to_elastic.content_hash = hashing.function
+
+    stages = dict(progress.stage_seconds)
+    # Bulk bodies are pre-encoded; the client serializer only handles the
+    # other requests (mget), which happen inside "send"
+    stages["serialize"] += serializer.seconds
+    stages["send"] = max(stages["send"] - serializer.seconds, 0.0)
+    # The content hash is computed while transforming but is JSON encoding too
+    stages["serialize"] += hashing.seconds
+    stages["transform"] = max(stages["transform"] - hashing.seconds, 0.0)
+
+    return {
+        "docs": progress.processed,
+        "successful": progress.successful,
+        "failed": progress.failed,
+        "workers": args.workers,
+        "batch_size": args.batch_size,
+        "elapsed_seconds": round(elapsed, 3),
+        "docs_per_sec": round(progress.processed / elapsed, 1) if elapsed else 0.0,
+        "json_encoder": "orjson" if mongo_to_elastic.USE_ORJSON else "json",
+        "compressed_storage": args.compress,
+        "collection_mb": round(collection.size_bytes / 1024 / 1024, 1),
+        "serialize_seconds_per_million_docs": (
+            round(stages["serialize"] / progress.processed * 1e6, 1)
+            if progress.processed
+            else 0.0
+        ),
+        "bulk_requests": stub.server.bulk_requests,
+        "bulk_mb": round(stub.server.bulk_bytes / 1024 / 1024, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "peak_rss_before_run_mb": round(rss_before, 1),
+        "stage_seconds": {
+            stage: round(seconds, 3) for stage, seconds in stages.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Mongo -> Elasticsearch indexer against local stand-ins"
+    )
+    parser.add_argument(
+        "--docs", type=int, default=10000, help="Number of synthetic documents"
+    )
+    parser.add_argument(
+        "--content-kb", type=float, default=8, help="Median article content size in KB"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=100, help="Mongo read batch size"
+    )
+    parser.add_argument("--workers", type=int, default=1, help="Bulk worker threads")
+    parser.add_argument(
+        "--bulk-bytes",
+        type=int,
+        default=5 * 1024 * 1024,
+        help="Initial byte budget per bulk request",
+    )
+    parser.add_argument(
+        "--skip-unchanged",
+        action="store_true",
+        help="Include the content-hash lookup (the stub never has the document)",
+    )
+    parser.add_argument(
+        "--stdlib-json",
+        action="store_true",
+        help="Encode bulk bodies with the json module even if orjson is installed",
+    )
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        help=f"Store {', '.join(COMPRESS_FIELDS)} zstd-compressed, as MONGODB_COMPRESS_FIELDS does",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=42, help="Random seed for the corpus"
+    )
+    parser.add_argument(
+        "--output", type=str, help="Write the results as JSON to this file"
+    )
+    args = parser.parse_args()
+
+    if args.compress and zstandard is None:
+        parser.error("--compress needs the zstandard package")
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    # Per-batch progress lines would dominate the output
+    logging.getLogger("mongo_to_elastic").setLevel(logging.WARNING)
+    logging.getLogger("elastic_transport").setLevel(logging.WARNING)
+
+    if args.stdlib_json:
+        mongo_to_elastic.USE_ORJSON = False
+
+    results = run_benchmark(args)
+
+    logger.info(
+        f"{results['docs']} documents in {results['elapsed_seconds']}s: {results['docs_per_sec']} docs/s, "
+        f"{results['bulk_requests']} bulk requests ({results['bulk_mb']} MB), peak RSS {results['peak_rss_mb']} MB"
+    )
+    for stage, seconds in results["stage_seconds"].items():
+        per_doc = seconds / results["docs"] * 1e6 if results["docs"] else 0.0
+        logger.info(f"  {stage:<10} {seconds:8.3f}s  {per_doc:8.1f} us/doc")
+    logger.info(
+        f"Collection size ({'zstd fields' if results['compressed_storage'] else 'plain'}): "
+        f"{results['collection_mb']} MB of BSON"
+    )
+    logger.info(
+        f"Serialization ({results['json_encoder']}): {results['serialize_seconds_per_million_docs']} CPU seconds per million documents"
+    )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        logger.info(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
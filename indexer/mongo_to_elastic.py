@@ -1,30 +1,1551 @@
 # search-engine/indexing/mongo_to_elastic.py
 
 import argparse
+import datetime
+import hashlib
+import json
+import logging
+import multiprocessing
 import os
+import queue
+import re
+import socket
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from contextlib import contextmanager
 import pymongo
-from elasticsearch import Elasticsearch
-from elasticsearch.helpers import bulk, BulkIndexError
+from bson import ObjectId
+from elasticsearch import ApiError, Elasticsearch
 
+from sources import (
+    DEFAULT_SOURCE,
+    SOURCES,
+    build_document,
+    get_source,
+    source_mapping,
+    source_projection,
+    with_passages,
+)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Per (collection, index) high-water marks and change stream resume tokens.
+STATE_COLLECTION = "indexer_state"
+
+# Documents that failed to transform or index, per (collection, index), so
+# they can be replayed without a full run.
+DEAD_LETTER_COLLECTION = "indexer_dead_letters"
+
+# Progress of individual runs, kept outside the source databases so a job can
+# be resumed knowing only its checkpoint id.
+CHECKPOINT_DB = "indexer"
+CHECKPOINT_COLLECTION = "checkpoints"
+
+# One lease per alias held by a --reindex run, in CHECKPOINT_DB so runs from
+# every source database see it. A lease that is not renewed for
+# REINDEX_LOCK_SECONDS, because its run crashed, can be taken over.
+REINDEX_LOCK_COLLECTION = "reindex_locks"
+REINDEX_LOCK_SECONDS = 120
+
+
+class JobCancelled(Exception):
+    """Raised inside a run once its cancel_event has been set."""
+
+
+def iter_mongo_batches(
+    mongo_collection, batch_size, query=None, projection=None, start_after=None
+):
+    """
+    Stream documents in _id order using keyset pagination.
+
+    Each batch resumes from the last _id seen instead of using skip(), so every
+    query is an index range scan and documents inserted during the run do not
+    shift the window. start_after skips everything up to and including that _id.
+    """
+
+    query = query or {}
+    last_id = start_after
+
+    while True:
+        if last_id is None:
+            batch_query = query
+        elif query:
+            batch_query = {"$and": [query, {"_id": {"$gt": last_id}}]}
+        else:
+            batch_query = {"_id": {"$gt": last_id}}
+
+        batch = list(
+            mongo_collection.find(batch_query, projection)
+            .sort("_id", pymongo.ASCENDING)
+            .limit(batch_size)
+        )
+
+        if not batch:
+            return
+
+        last_id = batch[-1]["_id"]
+        yield batch
+
+
+def load_index_state(mongo_collection, index_name):
+    """Return the stored incremental state for this collection/index pair."""
+
+    state = mongo_collection.database[STATE_COLLECTION].find_one(
+        {"_id": f"{mongo_collection.name}:{index_name}"}
+    )
+    return state or {}
+
+
+def save_index_state(mongo_collection, index_name, **fields):
+    """Merge fields into the stored incremental state."""
+
+    fields["updated_at"] = datetime.datetime.now(datetime.UTC).isoformat()
+    mongo_collection.database[STATE_COLLECTION].update_one(
+        {"_id": f"{mongo_collection.name}:{index_name}"},
+        {"$set": fields},
+        upsert=True,
+    )
+
+
+def current_high_water(mongo_collection, field, lag_seconds=0):
+    """
+    Return the largest value of field in the collection, or None.
+
+    Taken before reading so documents written during the run, which may land
+    behind the read cursor, are picked up by the next incremental run. Date
+    marks are held lag_seconds behind the server's clock, so writes stamped
+    just before the snapshot but not yet visible are not skipped.
+    """
+
+    latest = mongo_collection.find_one(
+        {field: {"$ne": None}}, {field: 1}, sort=[(field, pymongo.DESCENDING)]
+    )
+    if not latest:
+        return None
+
+    high_water = latest[field]
+    if lag_seconds and isinstance(high_water, datetime.datetime):
+        server_time = mongo_collection.database.client.admin.command("hello")[
+            "localTime"
+        ]
+        cutoff = server_time.replace(tzinfo=high_water.tzinfo) - datetime.timedelta(
+            seconds=lag_seconds
+        )
+        high_water = min(high_water, cutoff)
+    return high_water
+
+
+def save_dead_letters(mongo_collection, index_name, failures, stage):
+    """
+    Record (doc_id, reason) failures from stage ("transform", "index" or
+    "follow") in the dead-letter collection.
+
+    Errors are logged rather than raised so a Mongo hiccup does not abort the
+    run whose failures are being recorded. Returns whether they were recorded.
+    """
+
+    if not failures:
+        return True
+
+    failed_at = datetime.datetime.now(datetime.UTC)
+    requests = [
+        pymongo.UpdateOne(
+            {"_id": f"{mongo_collection.name}:{index_name}:{doc_id}"},
+            {
+                "$set": {
+                    "collection": mongo_collection.name,
+                    "index": index_name,
+                    "doc_id": doc_id,
+                    "stage": stage,
+                    "reason": reason[:2000],
+                    "failed_at": failed_at,
+                },
+                "$inc": {"attempts": 1},
+            },
+            upsert=True,
+        )
+        for doc_id, reason in failures
+    ]
 
-def extract_title_from_url(url):
-    """Extract a title from a Wikipedia URL by formatting the last path component."""
     try:
-        # Extract the last part of the URL path (after the last slash)
-        last_path_component = url.split("/")[-1]
+        mongo_collection.database[DEAD_LETTER_COLLECTION].bulk_write(
+            requests, ordered=False
+        )
+    except Exception as e:
+        logger.error(f"Could not record {len(failures)} dead letters: {e}")
+        return False
+    return True
+
+
+def parse_doc_id(doc_id):
+    """Turn a document id as sent to Elasticsearch back into a Mongo _id."""
+
+    return ObjectId(doc_id) if ObjectId.is_valid(doc_id) else doc_id
+
+
+def source_for(args):
+    """Schema selected by --source, with --passages applied."""
+
+    source = get_source(args.source)
+    if args.passages:
+        source = with_passages(source)
+    return source
+
+
+def build_action(doc, index_name, source):
+    """Transform a MongoDB document into a bulk index action for source."""
+
+    doc_id = str(doc.pop("_id", ""))
+    indexed_doc = build_document(source, doc)
+    indexed_doc["content_hash"] = content_hash(indexed_doc)
+
+    return {"_index": index_name, "_id": doc_id, "_source": indexed_doc}
+
+
+# Bumped whenever the hashed encoding changes, so stale stored hashes never match
+CONTENT_HASH_VERSION = 2
+
+
+def content_hash(indexed_doc):
+    """
+    Stable hash of the indexed fields, used to skip unchanged documents.
+
+    Hashes the compact, key-sorted JSON of the document: orjson's output when
+    it is installed, and the same encoding from the json module otherwise.
+    """
+
+    if USE_ORJSON:
+        payload = orjson.dumps(
+            indexed_doc, default=json_default, option=orjson.OPT_SORT_KEYS
+        )
+    else:
+        payload = json.dumps(
+            indexed_doc,
+            sort_keys=True,
+            ensure_ascii=False,
+            separators=(",", ":"),
+            default=json_default,
+        ).encode("utf-8")
+    digest = hashlib.blake2b(payload, digest_size=16).hexdigest()
+    return f"{CONTENT_HASH_VERSION}:{digest}"
+
+
+def json_default(value):
+    """Encode values JSON has no type for the way the Elasticsearch client does."""
+
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+# Switched off by the benchmark to measure the stdlib json path
+USE_ORJSON = orjson is not None
 
-        # Replace underscores with spaces and decode URL encoding
-        from urllib.parse import unquote
 
-        title = unquote(last_path_component.replace("_", " "))
+def dumps(value):
+    """Serialize value to compact UTF-8 JSON, with orjson when it is installed."""
 
-        return title
+    if USE_ORJSON:
+        return orjson.dumps(value, default=json_default)
+    return json.dumps(
+        value, default=json_default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def encode_action(action):
+    """Encode a bulk action as its NDJSON lines, ready to be sent as-is."""
+
+    op_type = action.get("_op_type", "index")
+    meta = dumps({op_type: {"_index": action["_index"], "_id": action["_id"]}})
+
+    if op_type == "delete":
+        return meta + b"\n"
+    return meta + b"\n" + dumps(action["_source"]) + b"\n"
+
+
+def client_serializers():
+    """Serializers for Elasticsearch(serializers=...): orjson when available."""
+
+    if not USE_ORJSON:
+        return {}
+
+    from elasticsearch.serializer import OrjsonSerializer
+
+    return {"application/json": OrjsonSerializer()}
+
+
+def drop_unchanged(es_client, index_name, actions):
+    """
+    Remove actions whose document is already indexed with the same hash.
+
+    Returns the remaining actions and the number of skipped ones.
+    """
+
+    try:
+        response = es_client.mget(
+            index=index_name,
+            ids=[action["_id"] for action in actions],
+            source_includes=["content_hash"],
+        )
     except Exception as e:
-        print(f"Error extracting title from URL {url}: {e}")
-        return ""
+        logger.warning(f"Could not fetch stored hashes, sending the whole batch: {e}")
+        return actions, 0
 
+    stored = {
+        doc["_id"]: doc["_source"].get("content_hash")
+        for doc in response["docs"]
+        if doc.get("found")
+    }
+    changed = [
+        action
+        for action in actions
+        if stored.get(action["_id"]) != action["_source"]["content_hash"]
+    ]
+    return changed, len(actions) - len(changed)
 
-def main():
+
+def send_bulk(
+    es_client,
+    actions,
+    payloads=None,
+    failures=None,
+    max_retries=5,
+    initial_backoff=1.0,
+):
+    """
+    Send actions as one bulk request and return (successful, failed, rejections).
+
+    payloads are the actions' pre-encoded NDJSON lines (see encode_action);
+    they are computed here if not given. If failures is a list, a (doc_id,
+    reason) pair is appended to it for each failed action. Items rejected with 429
+    (es_rejected_execution_exception), or the whole request if Elasticsearch
+    answers 429, are retried with exponential backoff. rejections counts how
+    many times Elasticsearch pushed back.
+    """
+
+    if payloads is None:
+        payloads = [encode_action(action) for action in actions]
+
+    pending = list(zip(actions, payloads))
+    successful = 0
+    failed = 0
+    rejections = 0
+
+    for attempt in range(max_retries + 1):
+        backoff = min(initial_backoff * 2**attempt, 60)
+
+        try:
+            response = es_client.bulk(
+                operations=b"".join(payload for _, payload in pending),
+                filter_path="errors,items.*.status,items.*._id,items.*.error",
+            )
+        except ApiError as e:
+            if e.status_code == 429 and attempt < max_retries:
+                rejections += 1
+                logger.warning(
+                    f"Bulk request rejected, retrying {len(pending)} actions in {backoff:.1f}s"
+                )
+                time.sleep(backoff)
+                continue
+            logger.error(f"Unexpected error during batch indexing: {e}")
+            if failures is not None:
+                failures.extend((action["_id"], str(e)) for action, _ in pending)
+            return successful, failed + len(pending), rejections
+        except Exception as e:
+            logger.error(f"Unexpected error during batch indexing: {e}")
+            if failures is not None:
+                failures.extend((action["_id"], str(e)) for action, _ in pending)
+            return successful, failed + len(pending), rejections
+
+        if not response.get("errors"):
+            successful += len(pending)
+            break
+
+        rejected = []
+
+        for item, entry in zip(response["items"], pending):
+            op_type, info = next(iter(item.items()))
+            status = info.get("status", 500)
+            if status < 300:
+                successful += 1
+            elif status == 429:
+                rejected.append(entry)
+            elif op_type == "delete" and status == 404:
+                # Document was already gone
+                successful += 1
+            else:
+                logger.error(f"Indexing error: {item}")
+                failed += 1
+                if failures is not None:
+                    failures.append(
+                        (entry[0]["_id"], json.dumps(info.get("error", info)))
+                    )
+
+        if not rejected:
+            break
+
+        rejections += 1
+        pending = rejected
+
+        if attempt == max_retries:
+            logger.error(
+                f"{len(pending)} actions still rejected after {max_retries} retries"
+            )
+            failed += len(pending)
+            if failures is not None:
+                failures.extend(
+                    (action["_id"], f"rejected after {max_retries} retries")
+                    for action, _ in pending
+                )
+            break
+
+        logger.warning(f"{len(pending)} actions rejected, retrying in {backoff:.1f}s")
+        time.sleep(backoff)
+
+    return successful, failed, rejections
+
+
+class AdaptiveBatcher:
+    """
+    Splits actions into bulk requests that fit a byte budget.
+
+    The budget halves whenever Elasticsearch rejects a request, shrinks when
+    requests are slower than target_latency and grows again while they stay
+    well under it.
+    """
+
+    def __init__(
+        self,
+        target_bytes=5 * 1024 * 1024,
+        min_bytes=256 * 1024,
+        max_bytes=25 * 1024 * 1024,
+        target_latency=1.0,
+    ):
+        self.min_bytes = min_bytes
+        self.max_bytes = max(max_bytes, min_bytes)
+        self.target_bytes = min(max(target_bytes, min_bytes), self.max_bytes)
+        self.target_latency = target_latency
+        self._lock = threading.Lock()
+
+    def split(self, actions, payloads):
+        """
+        Yield (actions, payloads, size) chunks, each within the current byte
+        budget, where payloads are the actions' encoded NDJSON lines.
+        """
+
+        budget = self.target_bytes
+        chunk = []
+        chunk_payloads = []
+        chunk_bytes = 0
+
+        for action, payload in zip(actions, payloads):
+            if chunk and chunk_bytes + len(payload) > budget:
+                yield chunk, chunk_payloads, chunk_bytes
+                chunk = []
+                chunk_payloads = []
+                chunk_bytes = 0
+            chunk.append(action)
+            chunk_payloads.append(payload)
+            chunk_bytes += len(payload)
+
+        if chunk:
+            yield chunk, chunk_payloads, chunk_bytes
+
+    def record(self, latency, rejections):
+        with self._lock:
+            previous = self.target_bytes
+
+            if rejections:
+                self.target_bytes = max(self.min_bytes, self.target_bytes // 2)
+            elif latency > self.target_latency * 1.5:
+                self.target_bytes = max(self.min_bytes, int(self.target_bytes * 0.75))
+            elif latency < self.target_latency / 2:
+                self.target_bytes = min(self.max_bytes, int(self.target_bytes * 1.25))
+
+            if self.target_bytes != previous:
+                logger.debug(
+                    f"Bulk budget {previous} -> {self.target_bytes} bytes (latency {latency:.2f}s, {rejections} rejections)"
+                )
+
+
+@contextmanager
+def bulk_load(es_client, index_name, index_settings, enabled=False, force_merge=False):
+    """
+    Wrap an indexing run and make its results searchable once at the end.
+
+    When enabled, refresh is switched off and replicas dropped to zero for the
+    duration of the run. Afterwards, even if the run fails, both are set back
+    to their values in index_settings (the "index" settings of the source's
+    index body). They are not read from the live index, which another bulk
+    load may have left in bulk-load mode. A single refresh (and optional
+    force-merge) follows a successful run.
+    """
+
+    restore = None
+
+    if enabled:
+        restore = {
+            "refresh_interval": index_settings.get("refresh_interval", "1s"),
+            "number_of_replicas": index_settings.get("number_of_replicas", 1),
+        }
+
+        es_client.indices.put_settings(
+            index=index_name,
+            settings={"index": {"refresh_interval": "-1", "number_of_replicas": 0}},
+        )
+        logger.info(
+            f"Bulk-load mode enabled for {index_name} (restoring {restore} afterwards)"
+        )
+
+    try:
+        yield
+    finally:
+        if restore is not None:
+            try:
+                es_client.indices.put_settings(
+                    index=index_name, settings={"index": restore}
+                )
+                logger.info(f"Restored settings for {index_name}: {restore}")
+            except Exception as e:
+                logger.error(f"Error restoring settings for {index_name}: {e}")
+
+    es_client.indices.refresh(index=index_name)
+    logger.info(f"Refreshed index {index_name}")
+
+    if force_merge:
+        logger.info(f"Force-merging index {index_name}...")
+        es_client.options(request_timeout=3600).indices.forcemerge(
+            index=index_name, max_num_segments=1
+        )
+        logger.info(f"Force-merged index {index_name}")
+
+
+class IndexProgress:
+    """
+    Counters shared between the Mongo reader and the bulk workers.
+
+    If on_progress is given it receives a snapshot() dict at most every
+    publish_interval seconds, and once more when the run finishes.
+    """
+
+    def __init__(self, total_docs, workers=1, on_progress=None, publish_interval=1.0):
+        self.total_docs = total_docs
+        self.workers = workers
+        self.processed = 0
+        self.successful = 0
+        self.failed = 0
+        # Failed documents missing from the dead-letter collection
+        self.unrecorded = 0
+        self.skipped = 0
+        self.sent_bytes = 0
+        self.worker_docs = {}
+        self.worker_seconds = {}
+        # Seconds spent per pipeline stage, summed across workers
+        self.stage_seconds = {
+            "read": 0.0,
+            "transform": 0.0,
+            "serialize": 0.0,
+            "send": 0.0,
+        }
+        self.started_at = time.monotonic()
+        self.last_batch_at = None
+        self.on_progress = on_progress
+        self.publish_interval = publish_interval
+        self._last_publish = 0.0
+        self._lock = threading.Lock()
+
+    def add_stage_time(self, stage, seconds):
+        with self._lock:
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+
+    def record_transform_failure(self):
+        with self._lock:
+            self.failed += 1
+
+    def record_batch(
+        self,
+        worker,
+        processed,
+        successful,
+        failed,
+        skipped,
+        sent_bytes,
+        elapsed,
+        unrecorded=0,
+    ):
+        with self._lock:
+            self.processed += processed
+            self.successful += successful
+            self.failed += failed
+            self.unrecorded += unrecorded
+            self.skipped += skipped
+            self.sent_bytes += sent_bytes
+            self.worker_docs[worker] = self.worker_docs.get(worker, 0) + successful
+            self.worker_seconds[worker] = self.worker_seconds.get(worker, 0.0) + elapsed
+            self.last_batch_at = datetime.datetime.now(datetime.UTC).isoformat()
+            self.report()
+
+            snapshot = None
+            if (
+                self.on_progress
+                and time.monotonic() - self._last_publish >= self.publish_interval
+            ):
+                self._last_publish = time.monotonic()
+                snapshot = self.snapshot()
+
+        if snapshot:
+            self.publish(snapshot)
+
+    def merge_snapshots(self, snapshots):
+        """Replace the counters with the sum of per-shard snapshots."""
+
+        with self._lock:
+            for name in (
+                "processed",
+                "successful",
+                "failed",
+                "unrecorded",
+                "skipped",
+                "sent_bytes",
+            ):
+                setattr(
+                    self,
+                    name,
+                    sum(snapshot.get(name, 0) for snapshot in snapshots.values()),
+                )
+            for shard, snapshot in snapshots.items():
+                self.worker_docs[shard] = snapshot["successful"]
+                self.worker_seconds[shard] = snapshot["elapsed_seconds"]
+            self.last_batch_at = max(
+                (s["last_batch_at"] for s in snapshots.values() if s["last_batch_at"]),
+                default=self.last_batch_at,
+            )
+            self.report()
+
+            snapshot = None
+            if (
+                self.on_progress
+                and time.monotonic() - self._last_publish >= self.publish_interval
+            ):
+                self._last_publish = time.monotonic()
+                snapshot = self.snapshot()
+
+        if snapshot:
+            self.publish(snapshot)
+
+    def snapshot(self):
+        """Structured view of the run so far."""
+
+        elapsed = time.monotonic() - self.started_at
+        docs_per_sec = self.processed / elapsed if elapsed else 0.0
+        remaining = max(self.total_docs - self.processed, 0)
+
+        return {
+            "total": self.total_docs,
+            "processed": self.processed,
+            "successful": self.successful,
+            "failed": self.failed,
+            "unrecorded": self.unrecorded,
+            "skipped": self.skipped,
+            "sent_bytes": self.sent_bytes,
+            "elapsed_seconds": round(elapsed, 1),
+            "docs_per_sec": round(docs_per_sec, 1),
+            "bytes_per_sec": round(self.sent_bytes / elapsed if elapsed else 0.0, 1),
+            "eta_seconds": round(remaining / docs_per_sec, 1) if docs_per_sec else None,
+            "last_batch_at": self.last_batch_at,
+        }
+
+    def publish(self, snapshot=None):
+        if not self.on_progress:
+            return
+        try:
+            self.on_progress(snapshot or self.snapshot())
+        except Exception as e:
+            logger.warning(f"Could not publish progress: {e}")
+
+    def report(self):
+        elapsed = time.monotonic() - self.started_at
+        rate = self.processed / elapsed if elapsed else 0.0
+        line = f"Progress: {self.processed}/{self.total_docs} documents processed, {self.successful} successful, {self.failed} failed, {self.skipped} unchanged, {rate:.1f} docs/s"
+
+        if self.workers > 1:
+            rates = []
+            for worker in sorted(self.worker_docs):
+                seconds = self.worker_seconds[worker]
+                rate = self.worker_docs[worker] / seconds if seconds else 0.0
+                rates.append(f"w{worker} {rate:.1f} docs/s")
+            line += f" | {', '.join(rates)}"
+
+        logger.info(line)
+
+
+class Checkpoint:
+    """
+    Persists how far a run has got so it can be resumed after a crash.
+
+    Batches are numbered in read order. last_id only moves past a batch once
+    it and every batch before it have been acknowledged by Elasticsearch, so
+    resuming from it never skips documents, even with several workers.
+    """
+
+    COUNTERS = ("processed", "successful", "failed", "unrecorded", "skipped")
+
+    def __init__(self, collection, checkpoint_id, resume=False):
+        self.collection = collection
+        self.checkpoint_id = checkpoint_id
+        self.resume = resume
+        self.state = {}
+        if resume:
+            self.state = collection.find_one({"_id": checkpoint_id}) or {}
+        self.last_id = self.state.get("last_id")
+        self.counters = {name: self.state.get(name, 0) for name in self.COUNTERS}
+        self._done = {}
+        self._next_seq = 0
+        self._lock = threading.Lock()
+
+    def start(self, args):
+        """Record the run's arguments, keeping any previous position."""
+
+        if self.resume and self.last_id is not None:
+            logger.info(
+                f"Resuming checkpoint {self.checkpoint_id} after _id {self.last_id} ({self.counters['processed']} already processed)"
+            )
+        self.save(
+            args={key: value for key, value in vars(args).items()},
+            status="running",
+            last_id=self.last_id,
+            **self.counters,
+        )
+
+    def restore(self, progress):
+        """Seed progress counters from the stored checkpoint."""
+
+        for name in self.COUNTERS:
+            setattr(progress, name, self.counters[name])
+
+    def batch_done(self, seq, last_id, counters):
+        with self._lock:
+            self._done[seq] = (last_id, counters)
+
+            advanced = False
+            while self._next_seq in self._done:
+                self.last_id, batch_counters = self._done.pop(self._next_seq)
+                for name, value in batch_counters.items():
+                    self.counters[name] += value
+                self._next_seq += 1
+                advanced = True
+
+            if advanced:
+                self.save(last_id=self.last_id, **self.counters)
+
+    def finish(self, status):
+        self.save(status=status)
+
+    def save(self, **fields):
+        fields["updated_at"] = datetime.datetime.now(datetime.UTC).isoformat()
+        try:
+            self.collection.update_one(
+                {"_id": self.checkpoint_id}, {"$set": fields}, upsert=True
+            )
+        except Exception as e:
+            logger.warning(f"Could not save checkpoint {self.checkpoint_id}: {e}")
+
+
+def process_in_batches(
+    mongo_collection,
+    es_client,
+    index_name,
+    batch_size,
+    workers=1,
+    query=None,
+    skip_unchanged=False,
+    on_progress=None,
+    batcher=None,
+    checkpoint=None,
+    dead_letter_index=None,
+    source=None,
+    cancel_event=None,
+):
+    """
+    Index the documents matching query (default: all) into Elasticsearch.
+
+    The calling thread reads and transforms batches. With more than one worker
+    the bulk requests are handed to a pool of threads through a bounded queue,
+    so Mongo reads and Elasticsearch writes overlap. With skip_unchanged,
+    documents whose stored content_hash matches are not sent.
+    on_progress is called with IndexProgress.snapshot() dicts as the run goes.
+    batch_size is the number of documents read from Mongo at a time; the bulk
+    requests themselves are sized in bytes by batcher (an AdaptiveBatcher).
+    A Checkpoint records acknowledged batches and, when resuming, sets the
+    starting _id and counters. If dead_letter_index is given, documents that
+    fail are recorded in the dead-letter collection under that index name.
+    source is the schema (see sources.py) documents are transformed with.
+    Setting cancel_event (a threading.Event) stops the run with JobCancelled
+    after the batches already read have been sent. If sending a batch raises,
+    its documents are counted as failed (and dead-lettered) and the run stops
+    with that exception.
+    """
+
+    source = source or get_source(DEFAULT_SOURCE)
+    projection = source_projection(source)
+
+    total_docs = mongo_collection.count_documents(query or {})
+    logger.info(
+        f"Processing {total_docs} documents in batches of {batch_size} with {workers} worker(s)"
+    )
+
+    progress = IndexProgress(total_docs, workers, on_progress=on_progress)
+    batcher = batcher or AdaptiveBatcher()
+
+    start_after = None
+    if checkpoint and checkpoint.resume:
+        checkpoint.restore(progress)
+        start_after = checkpoint.last_id
+
+    def record_failures(failures, stage):
+        """Dead-letter failures, returning how many could not be recorded."""
+
+        if dead_letter_index and save_dead_letters(
+            mongo_collection, dead_letter_index, failures, stage
+        ):
+            return 0
+        return len(failures)
+
+    def index_batch(worker, seq, last_id, transform_failures, batch_len, actions):
+        started = time.monotonic()
+        skipped = 0
+        successful = 0
+        failed = 0
+        sent_bytes = 0
+        failures = []
+
+        if actions and skip_unchanged:
+            actions, skipped = drop_unchanged(es_client, index_name, actions)
+
+        encode_started = time.monotonic()
+        payloads = [encode_action(action) for action in actions]
+        progress.add_stage_time("serialize", time.monotonic() - encode_started)
+
+        for chunk, chunk_payloads, chunk_bytes in batcher.split(actions, payloads):
+            request_started = time.monotonic()
+            success, errors, rejections = send_bulk(
+                es_client, chunk, chunk_payloads, failures=failures
+            )
+            request_seconds = time.monotonic() - request_started
+            batcher.record(request_seconds, rejections)
+            progress.add_stage_time("send", request_seconds)
+            successful += success
+            failed += errors
+            sent_bytes += chunk_bytes
+
+        # Recorded before the checkpoint can move past this batch
+        unrecorded = record_failures(transform_failures, "transform")
+        unrecorded += record_failures(failures, "index")
+
+        progress.record_batch(
+            worker,
+            batch_len,
+            successful,
+            failed,
+            skipped,
+            sent_bytes,
+            time.monotonic() - started,
+            unrecorded=unrecorded,
+        )
+
+        if checkpoint:
+            checkpoint.batch_done(
+                seq,
+                last_id,
+                {
+                    "processed": batch_len,
+                    "successful": successful,
+                    "failed": failed + len(transform_failures),
+                    "unrecorded": unrecorded,
+                    "skipped": skipped,
+                },
+            )
+
+    def fail_batch(worker, work, error):
+        seq, last_id, transform_failures, batch_len, actions = work
+        logger.error(f"Batch {seq} into {index_name} failed: {error!r}")
+
+        unrecorded = record_failures(transform_failures, "transform")
+        unrecorded += record_failures(
+            [(action["_id"], repr(error)) for action in actions], "index"
+        )
+        progress.record_batch(
+            worker, batch_len, 0, len(actions), 0, 0, 0.0, unrecorded=unrecorded
+        )
+
+    # Exceptions raised on the bulk workers, re-raised by the reading thread
+    worker_errors = []
+
+    def bulk_worker(worker, work_queue):
+        while True:
+            work = work_queue.get()
+            if work is None:
+                return
+            if worker_errors:
+                # The run is failing: keep draining so the reader never blocks
+                continue
+            try:
+                index_batch(worker, *work)
+            except Exception as e:
+                fail_batch(worker, work, e)
+                worker_errors.append(e)
+
+    work_queue = None
+    threads = []
+    if workers > 1:
+        work_queue = queue.Queue(maxsize=workers * 2)
+        for worker in range(workers):
+            # Named after the calling thread so logs can be traced to the job
+            thread = threading.Thread(
+                target=bulk_worker,
+                args=(worker, work_queue),
+                name=f"{threading.current_thread().name}/worker-{worker}",
+                daemon=True,
+            )
+            thread.start()
+            threads.append(thread)
+
+    try:
+        batches = iter_mongo_batches(
+            mongo_collection,
+            batch_size,
+            query=query,
+            projection=projection,
+            start_after=start_after,
+        )
+        seq = 0
+
+        while True:
+            if worker_errors:
+                raise worker_errors[0]
+            if cancel_event is not None and cancel_event.is_set():
+                raise JobCancelled(f"Indexing into {index_name} was cancelled")
+
+            read_started = time.monotonic()
+            batch = next(batches, None)
+            progress.add_stage_time("read", time.monotonic() - read_started)
+
+            if batch is None:
+                break
+
+            last_id = batch[-1]["_id"]
+            actions = []
+            transform_failures = []
+            transform_started = time.monotonic()
+
+            for doc in batch:
+                doc_id = str(doc.get("_id", ""))
+                try:
+                    actions.append(build_action(doc, index_name, source))
+                except Exception as e:
+                    logger.error(f"Error processing document: {e}")
+                    progress.record_transform_failure()
+                    transform_failures.append((doc_id, repr(e)))
+
+            progress.add_stage_time("transform", time.monotonic() - transform_started)
+
+            work = (seq, last_id, transform_failures, len(batch), actions)
+            seq += 1
+
+            if work_queue is None:
+                try:
+                    index_batch(0, *work)
+                except Exception as e:
+                    fail_batch(0, work, e)
+                    raise
+            else:
+                work_queue.put(work)
+    finally:
+        if work_queue is not None:
+            for _ in threads:
+                work_queue.put(None)
+            for thread in threads:
+                thread.join()
+
+    if worker_errors:
+        raise worker_errors[0]
+
+    progress.publish()
+    return progress
+
+
+def retry_dead_letters(
+    mongo_collection,
+    es_client,
+    index_name,
+    batch_size,
+    workers=1,
+    on_progress=None,
+    batcher=None,
+    source=None,
+    cancel_event=None,
+):
+    """
+    Re-index only the documents recorded as failed for this collection/index.
+
+    Documents that index successfully this time are removed from the
+    dead-letter collection, failures are recorded again with attempts
+    incremented. Documents that no longer exist in Mongo are deleted from the
+    index and dropped from the dead letters.
+    """
+
+    dead_letters = mongo_collection.database[DEAD_LETTER_COLLECTION]
+    key = {"collection": mongo_collection.name, "index": index_name}
+    doc_ids = [entry["doc_id"] for entry in dead_letters.find(key, {"doc_id": 1})]
+
+    if not doc_ids:
+        logger.info(f"No dead letters for {mongo_collection.name} -> {index_name}")
+        return IndexProgress(0)
+
+    logger.info(f"Retrying {len(doc_ids)} dead-lettered documents")
+    retry_started = datetime.datetime.now(datetime.UTC)
+    ids = [parse_doc_id(doc_id) for doc_id in doc_ids]
+
+    existing = {
+        str(doc["_id"])
+        for doc in mongo_collection.find({"_id": {"$in": ids}}, {"_id": 1})
+    }
+    missing = [doc_id for doc_id in doc_ids if doc_id not in existing]
+    if missing:
+        logger.info(f"{len(missing)} documents are gone from Mongo, deleting them")
+        send_bulk(
+            es_client,
+            [
+                {"_op_type": "delete", "_index": index_name, "_id": doc_id}
+                for doc_id in missing
+            ],
+        )
+
+    progress = process_in_batches(
+        mongo_collection,
+        es_client,
+        index_name,
+        batch_size,
+        workers=workers,
+        query={"_id": {"$in": ids}},
+        on_progress=on_progress,
+        batcher=batcher,
+        dead_letter_index=index_name,
+        source=source,
+        cancel_event=cancel_event,
+    )
+
+    # Anything not recorded again during this run has been repaired
+    result = dead_letters.delete_many({**key, "failed_at": {"$lt": retry_started}})
+    logger.info(
+        f"Retry finished: {result.deleted_count} dead letters cleared, {progress.failed} still failing"
+    )
+    return progress
+
+
+def split_id_ranges(mongo_collection, shards, query=None):
+    """
+    Return _id boundaries splitting the matching documents into shards ranges
+    of roughly equal size, using $bucketAuto.
+    """
+
+    buckets = list(
+        mongo_collection.aggregate(
+            [
+                {"$match": query or {}},
+                {"$bucketAuto": {"groupBy": "$_id", "buckets": shards}},
+            ],
+            allowDiskUse=True,
+        )
+    )
+    return [bucket["_id"]["min"] for bucket in buckets[1:]]
+
+
+def shard_queries(query, bounds):
+    """Build one query per _id range; the outer ranges are open-ended."""
+
+    queries = []
+
+    for lower, upper in zip([None] + bounds, bounds + [None]):
+        id_range = {}
+        if lower is not None:
+            id_range["$gte"] = lower
+        if upper is not None:
+            id_range["$lt"] = upper
+
+        shard_query = {"_id": id_range} if id_range else {}
+        if query:
+            shard_query = {"$and": [query, shard_query]} if shard_query else query
+        queries.append(shard_query)
+
+    return queries
+
+
+def index_shard(
+    args,
+    shard,
+    index_name,
+    query,
+    skip_unchanged,
+    checkpoint_id,
+    dead_letter_index,
+    progress_queue,
+    cancel_event,
+):
+    """Entry point of a shard process: index one _id range with its own clients."""
+
+    logging.basicConfig(level=logging.INFO, format=f"[shard {shard}] %(message)s")
+
+    mongo_client = pymongo.MongoClient(args.mongo_uri)
+    es_client = Elasticsearch(
+        args.elastic_url, serializers=client_serializers(), request_timeout=30
+    )
+
+    checkpoint = None
+    if checkpoint_id:
+        checkpoint = Checkpoint(
+            mongo_client[CHECKPOINT_DB][CHECKPOINT_COLLECTION],
+            checkpoint_id,
+            resume=args.resume,
+        )
+        checkpoint.start(args)
+
+    try:
+        progress = process_in_batches(
+            mongo_client[args.mongo_db][args.mongo_collection],
+            es_client,
+            index_name,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            query=query,
+            skip_unchanged=skip_unchanged,
+            on_progress=lambda snapshot: progress_queue.put((shard, snapshot)),
+            batcher=AdaptiveBatcher(
+                target_bytes=args.bulk_bytes, max_bytes=args.max_bulk_bytes
+            ),
+            checkpoint=checkpoint,
+            dead_letter_index=dead_letter_index,
+            source=source_for(args),
+            cancel_event=cancel_event,
+        )
+    except JobCancelled:
+        if checkpoint:
+            checkpoint.finish("cancelled")
+        raise
+    except Exception:
+        if checkpoint:
+            checkpoint.finish("failed")
+        raise
+    finally:
+        mongo_client.close()
+
+    if checkpoint:
+        checkpoint.finish("completed")
+
+    return progress.snapshot()
+
+
+def process_sharded(
+    args,
+    mongo_collection,
+    index_name,
+    query=None,
+    skip_unchanged=False,
+    on_progress=None,
+    checkpoint=None,
+    dead_letter_index=None,
+    cancel_event=None,
+):
+    """
+    Split the matching documents into args.shards _id ranges and index each
+    one in its own process, aggregating their progress into one IndexProgress.
+
+    The range boundaries are stored on the checkpoint so a resumed run splits
+    the collection the same way.
+    """
+
+    bounds = None
+    if checkpoint and checkpoint.resume:
+        bounds = checkpoint.state.get("shard_bounds")
+    if bounds is None:
+        bounds = split_id_ranges(mongo_collection, args.shards, query)
+    if checkpoint:
+        checkpoint.save(shard_bounds=bounds)
+
+    queries = shard_queries(query, bounds)
+    total_docs = mongo_collection.count_documents(query or {})
+    logger.info(f"Processing {total_docs} documents in {len(queries)} shard processes")
+
+    progress = IndexProgress(total_docs, len(queries), on_progress=on_progress)
+    snapshots = {}
+    failures = []
+
+    # spawn, not fork: the parent may hold client connections and threads
+    context = multiprocessing.get_context("spawn")
+
+    with context.Manager() as manager, ProcessPoolExecutor(
+        max_workers=len(queries), mp_context=context
+    ) as pool:
+        progress_queue = manager.Queue()
+        # Shard processes cannot see cancel_event, they watch this copy
+        shard_cancel = manager.Event()
+        futures = {
+            pool.submit(
+                index_shard,
+                args,
+                shard,
+                index_name,
+                shard_query,
+                skip_unchanged,
+                f"{checkpoint.checkpoint_id}/shard-{shard}" if checkpoint else None,
+                dead_letter_index,
+                progress_queue,
+                shard_cancel,
+            ): shard
+            for shard, shard_query in enumerate(queries)
+        }
+
+        def drain(timeout):
+            try:
+                while True:
+                    shard, snapshot = progress_queue.get(timeout=timeout)
+                    snapshots[shard] = snapshot
+                    timeout = 0
+            except queue.Empty:
+                pass
+            if snapshots:
+                progress.merge_snapshots(snapshots)
+
+        pending = set(futures)
+        while pending:
+            if cancel_event is not None and cancel_event.is_set():
+                shard_cancel.set()
+            done, pending = wait(pending, timeout=1.0)
+            for future in done:
+                shard = futures[future]
+                try:
+                    snapshots[shard] = future.result()
+                except Exception as e:
+                    logger.error(f"Shard {shard} failed: {e}")
+                    failures.append(f"shard {shard}: {e}")
+            drain(0.1)
+
+    progress.merge_snapshots(snapshots)
+    progress.publish()
+
+    if cancel_event is not None and cancel_event.is_set():
+        raise JobCancelled(f"Indexing into {index_name} was cancelled")
+    if failures:
+        raise RuntimeError(f"{len(failures)} shard(s) failed: {'; '.join(failures)}")
+
+    return progress
+
+
+def list_index_versions(es_client, alias):
+    """Return {version: index name} for the {alias}_v{N} indices."""
+
+    pattern = re.compile(rf"^{re.escape(alias)}_v(\d+)$")
+    versions = {}
+
+    for name in es_client.indices.get(index=f"{alias}_v*"):
+        match = pattern.match(name)
+        if match:
+            versions[int(match.group(1))] = name
+
+    return versions
+
+
+def swap_alias(es_client, alias, new_index):
+    """Atomically point alias at new_index and away from everything else."""
+
+    actions = [{"add": {"index": new_index, "alias": alias}}]
+
+    if es_client.indices.exists_alias(name=alias):
+        for index in es_client.indices.get_alias(name=alias):
+            actions.append({"remove": {"index": index, "alias": alias}})
+    elif es_client.indices.exists(index=alias):
+        # Concrete index from before versioning; the alias needs its name
+        actions.append({"remove_index": {"index": alias}})
+
+    es_client.indices.update_aliases(actions=actions)
+
+
+def mark_served(es_client, alias, index):
+    """Record in index's mapping _meta that it has been behind alias."""
+
+    es_client.indices.put_mapping(index=index, meta={"served_alias": alias})
+
+
+def served_versions(es_client, alias, versions):
+    """
+    The versions that have been behind alias: those marked by mark_served
+    and those it points to now.
+    """
+
+    current = set()
+    if es_client.indices.exists_alias(name=alias):
+        current = set(es_client.indices.get_alias(name=alias).body)
+
+    mappings = es_client.indices.get_mapping(index=f"{alias}_v*").body
+    served = set()
+    for version, name in versions.items():
+        meta = mappings.get(name, {}).get("mappings", {}).get("_meta", {})
+        if name in current or meta.get("served_alias") == alias:
+            served.add(version)
+
+    return served
+
+
+@contextmanager
+def reindex_lock(lock_collection, alias, lease_seconds=REINDEX_LOCK_SECONDS):
+    """
+    Hold the reindex lease of alias for the duration of the block, renewing it
+    from a background thread. Raises RuntimeError if another run holds it.
+    """
+
+    owner = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+    def expiry():
+        return datetime.datetime.now(datetime.UTC) + datetime.timedelta(
+            seconds=lease_seconds
+        )
+
+    try:
+        # Matches a missing or expired lease; a live one makes the upsert
+        # collide on _id
+        lock_collection.find_one_and_update(
+            {"_id": alias, "expires_at": {"$lt": datetime.datetime.now(datetime.UTC)}},
+            {"$set": {"owner": owner, "expires_at": expiry()}},
+            upsert=True,
+        )
+    except pymongo.errors.DuplicateKeyError:
+        holder = lock_collection.find_one({"_id": alias}) or {}
+        raise RuntimeError(
+            f"Another reindex of {alias} is running ({holder.get('owner')})"
+        )
+
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(lease_seconds / 3):
+            try:
+                result = lock_collection.update_one(
+                    {"_id": alias, "owner": owner},
+                    {"$set": {"expires_at": expiry()}},
+                )
+                if not result.matched_count:
+                    logger.error(f"Lost the reindex lock of {alias}")
+            except Exception as e:
+                logger.warning(f"Could not renew the reindex lock of {alias}: {e}")
+
+    renewer = threading.Thread(target=renew, name=f"reindex-lock-{alias}", daemon=True)
+    renewer.start()
+
+    try:
+        yield
+    finally:
+        stop.set()
+        renewer.join()
+        lock_collection.delete_one({"_id": alias, "owner": owner})
+
+
+def reindex_with_alias(
+    es_client, alias, index_documents, mapping, force_merge=False, keep_versions=2
+):
+    """
+    Rebuild the index behind alias without touching the live one.
+
+    index_documents(index_name) fills a fresh {alias}_v{N+1} index and returns
+    its IndexProgress. The index is created with mapping, a full index body
+    (settings and mappings), and stays in bulk-load mode while it fills. Once
+    the document count is validated the alias is swapped in a single request.
+    Of the versions that have served the alias, the newest keep_versions are
+    kept for rollback; versions that never did (partial builds) are deleted,
+    so callers hold reindex_lock for the alias.
+
+    If the build fails, is cancelled or does not validate, the new index is
+    deleted and the alias is left unchanged.
+    """
+
+    versions = list_index_versions(es_client, alias)
+    served = served_versions(es_client, alias, versions)
+    new_version = max(versions, default=0) + 1
+    new_index = f"{alias}_v{new_version}"
+
+    es_client.indices.create(index=new_index, body=mapping)
+    logger.info(f"Created index {new_index} for alias {alias}")
+
+    try:
+        with bulk_load(
+            es_client,
+            new_index,
+            mapping["settings"]["index"],
+            enabled=True,
+            force_merge=force_merge,
+        ):
+            progress = index_documents(new_index)
+
+        indexed = es_client.count(index=new_index)["count"]
+        logger.info(
+            f"Index {new_index} holds {indexed} documents, {progress.successful} successful, {progress.failed} failed"
+        )
+
+        if progress.failed or indexed != progress.successful:
+            raise RuntimeError(
+                f"Validation of {new_index} failed ({indexed} indexed, {progress.successful} successful, "
+                f"{progress.failed} failed), alias {alias} left unchanged"
+            )
+
+        # Mark the live versions too, in case they predate the marker
+        for version in served:
+            mark_served(es_client, alias, versions[version])
+        mark_served(es_client, alias, new_index)
+        swap_alias(es_client, alias, new_index)
+    except Exception:
+        try:
+            es_client.indices.delete(index=new_index)
+            logger.info(f"Deleted partial index {new_index}")
+        except Exception as e:
+            logger.warning(f"Could not delete partial index {new_index}: {e}")
+        raise
+
+    logger.info(f"Alias {alias} now points to {new_index}")
+
+    served = sorted(served)
+    stale = served[: max(len(served) - (keep_versions - 1), 0)]
+    for version in sorted(versions):
+        if version in served and version not in stale:
+            continue
+        try:
+            es_client.indices.delete(index=versions[version])
+            logger.info(f"Deleted old index {versions[version]}")
+        except Exception as e:
+            logger.warning(f"Could not delete old index {versions[version]}: {e}")
+
+    return progress
+
+
+def change_to_action(change, index_name, source):
+    """Translate a change stream event into a bulk action (or None)."""
+
+    if change["operationType"] == "delete":
+        return {
+            "_op_type": "delete",
+            "_index": index_name,
+            "_id": str(change["documentKey"]["_id"]),
+        }
+
+    full_document = change.get("fullDocument")
+    if not full_document:
+        # Document was deleted before the update could be looked up
+        return None
+
+    doc = {
+        key: value
+        for key, value in full_document.items()
+        if key == "_id" or key in source_projection(source)
+    }
+    return build_action(doc, index_name, source)
+
+
+def follow_changes(
+    mongo_collection,
+    es_client,
+    index_name,
+    batch_size,
+    flush_interval=5.0,
+    start_at_operation_time=None,
+    source=None,
+    cancel_event=None,
+):
+    """
+    Tail the collection's change stream and mirror it into the index.
+
+    Changes are buffered and flushed every batch_size events or flush_interval
+    seconds. The resume token is saved after each flush, so a restarted
+    follower picks up where the previous one stopped. Requires MongoDB to run
+    as a replica set. Runs until cancel_event is set.
+    """
+
+    source = source or get_source(DEFAULT_SOURCE)
+    resume_token = load_index_state(mongo_collection, index_name).get("resume_token")
+    pipeline = [
+        {
+            "$match": {
+                "operationType": {"$in": ["insert", "update", "replace", "delete"]}
+            }
+        }
+    ]
+
+    actions = []
+    applied = 0
+    failed = 0
+    last_flush = time.monotonic()
+
+    with mongo_collection.watch(
+        pipeline,
+        full_document="updateLookup",
+        resume_after=resume_token,
+        start_at_operation_time=None if resume_token else start_at_operation_time,
+        max_await_time_ms=1000,
+    ) as stream:
+        logger.info(
+            f"Following changes on {mongo_collection.full_name} into {index_name}"
+        )
+
+        while stream.alive:
+            if cancel_event is not None and cancel_event.is_set():
+                logger.info(f"Stopped following changes into {index_name}")
+                break
+
+            change = stream.try_next()
+
+            if change is not None:
+                try:
+                    action = change_to_action(change, index_name, source)
+                    if action:
+                        actions.append(action)
+                except Exception as e:
+                    logger.error(f"Error processing change: {e}")
+                    failed += 1
+                    save_dead_letters(
+                        mongo_collection,
+                        index_name,
+                        [(str(change["documentKey"]["_id"]), repr(e))],
+                        "follow",
+                    )
+
+            if not actions:
+                last_flush = time.monotonic()
+                continue
+
+            if (
+                len(actions) >= batch_size
+                or time.monotonic() - last_flush >= flush_interval
+            ):
+                failures = []
+                success, errors, _ = send_bulk(es_client, actions, failures=failures)
+                save_dead_letters(mongo_collection, index_name, failures, "follow")
+                applied += success
+                failed += errors
+                actions = []
+                last_flush = time.monotonic()
+
+                save_index_state(
+                    mongo_collection, index_name, resume_token=stream.resume_token
+                )
+                logger.info(
+                    f"Change stream: {applied} changes applied, {failed} failed"
+                )
+
+
+def build_parser():
     parser = argparse.ArgumentParser(
         description="Transfer data from MongoDB to Elasticsearch"
     )
@@ -57,184 +1578,395 @@ def main():
         help="Elasticsearch index name",
     )
     parser.add_argument(
-        "--batch-size", type=int, default=100, help="Batch size for indexing"
+        "--source",
+        choices=sorted(SOURCES),
+        default=DEFAULT_SOURCE,
+        help="Schema (mapping and transform) of the documents being indexed",
+    )
+    parser.add_argument(
+        "--passages",
+        action="store_true",
+        help="Also index content as a nested field of short passages for cheap highlighting",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=100,
+        help="Number of documents read from MongoDB per batch",
+    )
+    parser.add_argument(
+        "--bulk-bytes",
+        type=int,
+        default=5 * 1024 * 1024,
+        help="Initial byte budget per bulk request, adapted to latency and rejections",
+    )
+    parser.add_argument(
+        "--max-bulk-bytes",
+        type=int,
+        default=25 * 1024 * 1024,
+        help="Upper bound for the adaptive bulk request size",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of threads sending bulk requests in parallel",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        help="Split the collection into N _id ranges indexed by separate processes",
+    )
+    parser.add_argument(
+        "--bulk-load",
+        action="store_true",
+        help="Disable refresh and replicas while indexing, restore them afterwards",
+    )
+    parser.add_argument(
+        "--force-merge",
+        action="store_true",
+        help="Force-merge the index down to one segment after indexing",
+    )
+    parser.add_argument(
+        "--checkpoint-id",
+        type=str,
+        default=None,
+        help="Id the run's progress is saved under (default: <db>.<collection>:<index>)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue from the last checkpoint saved under --checkpoint-id",
+    )
+    parser.add_argument(
+        "--skip-unchanged",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Skip documents whose content hash matches the indexed copy",
+    )
+    parser.add_argument(
+        "--reindex",
+        action="store_true",
+        help="Build a new {index}_v{N} index and atomically move the --elastic-index alias to it",
+    )
+    parser.add_argument(
+        "--keep-versions",
+        type=int,
+        default=2,
+        help="Number of versioned indices (including the new one) kept after --reindex",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only index documents newer than the last run's high-water mark",
+    )
+    parser.add_argument(
+        "--incremental-field",
+        type=str,
+        choices=["stored_at", "crawl_time", "_id"],
+        default="stored_at",
+        help="Field used as the high-water mark in incremental mode",
+    )
+    parser.add_argument(
+        "--incremental-lag-seconds",
+        type=float,
+        default=60.0,
+        help="Keep a date high-water mark this far behind Mongo's clock, for writes still in flight",
+    )
+    parser.add_argument(
+        "--retry-dead-letters",
+        action="store_true",
+        help="Only re-index the documents recorded as failed by previous runs",
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="Keep running and mirror the collection's change stream (needs a replica set)",
+    )
+    parser.add_argument(
+        "--follow-flush-seconds",
+        type=float,
+        default=5.0,
+        help="Maximum time changes are buffered before being sent in follow mode",
     )
 
-    args = parser.parse_args()
+    return parser
 
-    # Connect to MongoDB
-    try:
-        print(f"Connecting to MongoDB at {args.mongo_uri}...")
-        mongo_client = pymongo.MongoClient(args.mongo_uri)
-        mongo_db = mongo_client[args.mongo_db]
-        mongo_collection = mongo_db[args.mongo_collection]
 
-        # Test MongoDB connection
-        doc_count = mongo_collection.count_documents({})
-        print(
-            f"Successfully connected to MongoDB. Found {doc_count} documents in {args.mongo_db}.{args.mongo_collection}"
-        )
+def run_indexing(args, mongo_client, es_client, on_progress=None, cancel_event=None):
+    """
+    Run one indexing job described by parsed build_parser() arguments.
 
-        # Sample one document to inspect structure
-        sample_doc = mongo_collection.find_one()
-        print("\nSample document structure:")
-        for key, value in sample_doc.items():
-            if key == "_id":
-                print(f"_id: {value}")
-            else:
-                print(f"{key}: {type(value)}")
-                if (
-                    key == "internal_links"
-                    and isinstance(value, list)
-                    and len(value) > 0
-                ):
-                    print(f"  First internal_link item: {value[0]}")
+    The clients are passed in so long-running callers can share pooled
+    connections between jobs. on_progress receives progress snapshots.
+    Setting cancel_event (a threading.Event) stops the job with JobCancelled.
+    Returns the IndexProgress of the run.
+    """
 
-    except Exception as e:
-        print(f"Error connecting to MongoDB: {e}")
-        return
+    mongo_collection = mongo_client[args.mongo_db][args.mongo_collection]
+    index_name = args.elastic_index
+    source = source_for(args)
+    mapping = source_mapping(source)
+    batcher = AdaptiveBatcher(
+        target_bytes=args.bulk_bytes, max_bytes=args.max_bulk_bytes
+    )
 
-    # Connect to Elasticsearch
-    try:
-        print(f"Connecting to Elasticsearch at {args.elastic_url}")
-        es_client = Elasticsearch(args.elastic_url, request_timeout=30)
+    def index_documents(
+        target_index,
+        query=None,
+        skip_unchanged=False,
+        checkpoint=None,
+    ):
+        # Failures are recorded under the name callers use, the alias during
+        # a reindex, so --retry-dead-letters finds them
+        if args.shards > 1:
+            return process_sharded(
+                args,
+                mongo_collection,
+                target_index,
+                query=query,
+                skip_unchanged=skip_unchanged,
+                on_progress=on_progress,
+                checkpoint=checkpoint,
+                dead_letter_index=index_name,
+                cancel_event=cancel_event,
+            )
 
-        # Test Elasticsearch connection
-        es_info = es_client.info()
-        print(f"Successfully connected to Elasticsearch {es_info['version']['number']}")
-    except Exception as e:
-        print(f"Error connecting to Elasticsearch: {e}")
-        return
+        return process_in_batches(
+            mongo_collection,
+            es_client,
+            target_index,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            query=query,
+            skip_unchanged=skip_unchanged,
+            on_progress=on_progress,
+            batcher=batcher,
+            checkpoint=checkpoint,
+            dead_letter_index=index_name,
+            source=source,
+            cancel_event=cancel_event,
+        )
 
-    mapping = {
-        "mappings": {
-            "properties": {
-                "url": {"type": "keyword"},
-                "title": {"type": "text", "analyzer": "english"},
-                "summary": {"type": "text", "analyzer": "english"},
-                "content": {"type": "text", "analyzer": "english"},
-                "categories": {"type": "keyword"},
-                "link_urls": {"type": "keyword"},
-                "link_texts": {"type": "text", "analyzer": "english"},
-            }
-        },
-        "settings": {
-            "index": {
-                "number_of_shards": 1,
-                "number_of_replicas": 0,
-                "mapping.ignore_malformed": True,
-            }
-        },
-    }
+    if args.retry_dead_letters:
+        if args.reindex or args.incremental or args.resume:
+            raise ValueError(
+                "--retry-dead-letters only replays recorded failures, drop --reindex, --incremental and --resume"
+            )
 
-    index_name = args.elastic_index
+        return retry_dead_letters(
+            mongo_collection,
+            es_client,
+            index_name,
+            batch_size=args.batch_size,
+            workers=args.workers,
+            on_progress=on_progress,
+            batcher=batcher,
+            source=source,
+            cancel_event=cancel_event,
+        )
+
+    if args.reindex:
+        if args.incremental:
+            raise ValueError(
+                "--reindex always rebuilds the full index, drop --incremental"
+            )
+        if args.resume:
+            raise ValueError("--reindex builds a new index and cannot be resumed")
+
+        snapshot = current_high_water(
+            mongo_collection, args.incremental_field, args.incremental_lag_seconds
+        )
+        # Cleanup deletes the versions that never served the alias, which
+        # would include another run's index while it is being built
+        with reindex_lock(
+            mongo_client[CHECKPOINT_DB][REINDEX_LOCK_COLLECTION], index_name
+        ):
+            progress = reindex_with_alias(
+                es_client,
+                index_name,
+                index_documents,
+                mapping,
+                force_merge=args.force_merge,
+                keep_versions=args.keep_versions,
+            )
+
+        # Later incremental runs through the alias continue from this rebuild
+        if snapshot is not None:
+            save_index_state(
+                mongo_collection, index_name, **{args.incremental_field: snapshot}
+            )
+        return progress
 
     try:
         exists = es_client.indices.exists(index=index_name)
-        print(f"Index {index_name} exists: {exists}")
+        logger.info(f"Index {index_name} exists: {exists}")
 
         if exists:
             try:
                 es_client.indices.put_mapping(
                     index=index_name, body=mapping["mappings"]
                 )
-                print(f"Updated mapping for index {index_name}")
+                logger.info(f"Updated mapping for index {index_name}")
             except Exception as e:
-                print(f"Warning: Could not update mapping: {e}")
+                logger.warning(f"Could not update mapping: {e}")
         else:
             try:
                 es_client.indices.create(index=index_name, body=mapping)
-                print(f"Index {index_name} created successfully")
+                logger.info(f"Index {index_name} created successfully")
             except Exception as e:
-                print(f"Warning: Could not create mapping: {e}")
+                logger.warning(f"Could not create mapping: {e}")
 
     except Exception as e:
-        print(f"Error with index: {e}")
-        return
+        logger.error(f"Error with index: {e}")
+        raise
 
-    # Process documents in batches
-    def process_in_batches(batch_size=args.batch_size):
-        total_docs = mongo_collection.count_documents({})
-        print(f"Processing {total_docs} documents in batches of {batch_size}")
+    query = {}
+    watermark_field = None
+    snapshot = None
 
-        processed = 0
-        successful = 0
-        failed = 0
+    if args.incremental:
+        watermark_field = args.incremental_field
+        high_water = load_index_state(mongo_collection, index_name).get(watermark_field)
 
-        for skip in range(0, total_docs, batch_size):
+        if watermark_field != "_id":
+            mongo_collection.create_index(watermark_field)
 
-            batch = list(mongo_collection.find().skip(skip).limit(batch_size))
-            actions = []
+        # Read up to the mark saved at the end, whatever is written meanwhile
+        snapshot = current_high_water(
+            mongo_collection, watermark_field, args.incremental_lag_seconds
+        )
 
-            for doc in batch:
+        if high_water is not None:
+            query = {watermark_field: {"$gt": high_water, "$lte": snapshot}}
+            logger.info(
+                f"Incremental mode: indexing documents with {high_water} < {watermark_field} <= {snapshot}"
+            )
+        else:
+            logger.info(
+                "Incremental mode: no previous high-water mark, indexing everything"
+            )
 
-                try:
+    # Remember where the change stream has to start before reading anything
+    start_at_operation_time = None
+    if args.follow:
+        start_at_operation_time = mongo_client.admin.command("ping").get(
+            "operationTime"
+        )
 
-                    doc_id = str(doc.pop("_id", ""))
-
-                    link_urls = []
-                    link_texts = []
-
-                    internal_links = doc.get("internal_links", [])
-                    if isinstance(internal_links, list):
-                        for link in internal_links:
-                            if isinstance(link, dict):
-                                if "url" in link:
-                                    link_urls.append(link["url"])
-                                if "text" in link:
-                                    link_texts.append(link["text"])
-
-                    url = doc.get("url", "")
-                    title = doc.get("title", "")
-
-                    if not title and url:
-                        title = extract_title_from_url(url)
-
-                    indexed_doc = {
-                        "url": url,
-                        "title": title,
-                        "summary": doc.get("summary", ""),
-                        "content": doc.get("content", ""),
-                        "categories": doc.get("categories", []),
-                        "author": doc.get("author", ""),
-                        "link_urls": link_urls,
-                        "link_texts": link_texts,
-                    }
-
-                    actions.append(
-                        {"_index": index_name, "_id": doc_id, "_source": indexed_doc}
-                    )
-                except Exception as e:
-                    print(f"Error processing document: {e}")
-                    failed += 1
+    checkpoint = Checkpoint(
+        mongo_client[CHECKPOINT_DB][CHECKPOINT_COLLECTION],
+        args.checkpoint_id
+        or f"{args.mongo_db}.{args.mongo_collection}:{args.elastic_index}",
+        resume=args.resume,
+    )
+    checkpoint.start(args)
 
-            if actions:
-                try:
-                    # Perform bulk indexing for this batch
-                    success, errors = bulk(
-                        es_client, actions, refresh=True, stats_only=False
-                    )
-                    successful += success
-
-                    if errors:
-                        for error in errors:
-                            print(f"Indexing error: {error}")
-                        failed += len(errors)
-                except BulkIndexError as e:
-                    print(f"Bulk indexing error: {e}")
-                    print(f"First few error details: {e.errors[:3]}")
-                    failed += len(e.errors)
-                except Exception as e:
-                    print(f"Unexpected error during batch indexing: {e}")
-                    failed += len(actions)
+    # Process documents in batches
+    try:
+        with bulk_load(
+            es_client,
+            index_name,
+            mapping["settings"]["index"],
+            enabled=args.bulk_load,
+            force_merge=args.force_merge,
+        ):
+            progress = index_documents(
+                index_name,
+                query=query,
+                skip_unchanged=args.skip_unchanged,
+                checkpoint=checkpoint,
+            )
+    except JobCancelled:
+        checkpoint.finish("cancelled")
+        raise
+    except Exception:
+        checkpoint.finish("failed")
+        raise
+    checkpoint.finish("completed")
 
-            processed += len(batch)
-            print(
-                f"Progress: {processed}/{total_docs} documents processed, {successful} successful, {failed} failed"
+    if watermark_field:
+        # Dead-lettered failures are repaired by --retry-dead-letters, only
+        # failures that were not recorded have to be read again
+        if progress.unrecorded:
+            logger.warning(
+                f"{progress.unrecorded} failed documents could not be recorded as dead letters, keeping the previous high-water mark"
+            )
+        elif snapshot is not None:
+            save_index_state(
+                mongo_collection, index_name, **{watermark_field: snapshot}
             )
+            logger.info(f"Saved high-water mark {watermark_field} = {snapshot}")
 
-    # Process documents in batches
-    process_in_batches()
+    if args.follow:
+        follow_changes(
+            mongo_collection,
+            es_client,
+            index_name,
+            batch_size=args.batch_size,
+            flush_interval=args.follow_flush_seconds,
+            start_at_operation_time=start_at_operation_time,
+            source=source,
+            cancel_event=cancel_event,
+        )
+
+    return progress
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    args = build_parser().parse_args()
+
+    # Connect to MongoDB
+    try:
+        logger.info(f"Connecting to MongoDB at {args.mongo_uri}...")
+        mongo_client = pymongo.MongoClient(args.mongo_uri)
+        mongo_db = mongo_client[args.mongo_db]
+        mongo_collection = mongo_db[args.mongo_collection]
+
+        # Test MongoDB connection
+        doc_count = mongo_collection.count_documents({})
+        logger.info(
+            f"Successfully connected to MongoDB. Found {doc_count} documents in {args.mongo_db}.{args.mongo_collection}"
+        )
+
+        # Sample one document to inspect structure
+        sample_doc = mongo_collection.find_one()
+        logger.info("Sample document structure:")
+        for key, value in sample_doc.items():
+            if key == "_id":
+                logger.info(f"_id: {value}")
+            else:
+                logger.info(f"{key}: {type(value)}")
+                if (
+                    key == "internal_links"
+                    and isinstance(value, list)
+                    and len(value) > 0
+                ):
+                    logger.info(f"  First internal_link item: {value[0]}")
+
+    except Exception as e:
+        logger.error(f"Error connecting to MongoDB: {e}")
+        return
+
+    # Connect to Elasticsearch
+    try:
+        logger.info(f"Connecting to Elasticsearch at {args.elastic_url}")
+        es_client = Elasticsearch(
+            args.elastic_url, serializers=client_serializers(), request_timeout=30
+        )
+
+        # Test Elasticsearch connection
+        es_info = es_client.info()
+        logger.info(
+            f"Successfully connected to Elasticsearch {es_info['version']['number']}"
+        )
+    except Exception as e:
+        logger.error(f"Error connecting to Elasticsearch: {e}")
+        return
+
+    run_indexing(args, mongo_client, es_client)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,336 @@
+# search-engine/indexer/sources.py
+#
+# Per-source index schemas. Each source declares the fields its index stores:
+#
+#     "field": {
+#         "mapping": {...},          # Elasticsearch mapping of the field
+#         "from": "mongo_field",     # defaults to the field's own name
+#         "transform": callable,     # applied to the Mongo value
+#         "default": value,          # used when the value is missing
+#         "optional": True,          # leave the field out when missing instead
+#     }
+#
+# plus optional index "analysis" settings, a "finalize" hook for rules
+# spanning several fields and "enrichments": fields computed from the
+# transformed document ({"field": {"mapping": {...}, "compute": callable}}).
+# Only the Mongo fields the schema reads are fetched. Fields that change on
+# every crawl (crawl_time) are left out so unchanged documents keep their
+# content_hash. Fields the crawler stored compressed are decompressed before
+# the schema sees them.
+
+import copy
+import datetime
+import logging
+import math
+import json
+import unicodedata
+from urllib.parse import unquote
+
+from bson.binary import Binary
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+ENGLISH_TEXT = {"type": "text", "analyzer": "english"}
+
+# title.suggest indexes shingles and edge n-grams, so as-you-type prefix
+# queries (multi_match bool_prefix) match precomputed terms
+TITLE_TEXT = {
+    "type": "text",
+    "analyzer": "english",
+    "fields": {"suggest": {"type": "search_as_you_type"}},
+}
+
+WORDS_PER_MINUTE = 200
+
+# Target size of the content passages highlighting runs on (see --passages)
+PASSAGE_CHARS = 1000
+
+# BSON binary subtypes of fields the crawler stored zstd-compressed
+# (MONGODB_COMPRESS_FIELDS): UTF-8 text and JSON-encoded lists/dicts
+COMPRESSED_TEXT_SUBTYPE = 0x80
+COMPRESSED_JSON_SUBTYPE = 0x81
+
+INDEX_SETTINGS = {
+    "number_of_shards": 1,
+    "number_of_replicas": 0,
+    # Explicit, so bulk_load has a value to restore after disabling refresh
+    "refresh_interval": "1s",
+    "mapping.ignore_malformed": True,
+}
+
+
+def extract_title_from_url(url):
+    """Extract a title from a Wikipedia URL by formatting the last path component."""
+    try:
+        # Extract the last part of the URL path (after the last slash)
+        last_path_component = url.split("/")[-1]
+
+        # Replace underscores with spaces and decode URL encoding
+        title = unquote(last_path_component.replace("_", " "))
+
+        return title
+    except Exception as e:
+        logger.error(f"Error extracting title from URL {url}: {e}")
+        return ""
+
+
+def decompress_value(value):
+    """A field stored compressed by the crawler, decoded. Other values are returned as is."""
+
+    if not isinstance(value, Binary) or value.subtype not in (
+        COMPRESSED_TEXT_SUBTYPE,
+        COMPRESSED_JSON_SUBTYPE,
+    ):
+        return value
+    if zstandard is None:
+        raise RuntimeError(
+            "Document has zstd-compressed fields, install zstandard to index it"
+        )
+
+    data = zstandard.decompress(bytes(value))
+    if value.subtype == COMPRESSED_TEXT_SUBTYPE:
+        return data.decode("utf-8")
+    return json.loads(data)
+
+
+def link_field(key):
+    """Transform picking key out of each {"url": ..., "text": ...} link."""
+
+    def transform(links):
+        if not isinstance(links, list):
+            return []
+        return [link[key] for link in links if isinstance(link, dict) and key in link]
+
+    return transform
+
+
+def to_date(value):
+    """Normalize a datetime or ISO 8601 string for a date field, None if unparseable."""
+
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value).isoformat()
+    except (TypeError, ValueError):
+        return None
+
+
+def normalize_title(indexed_doc):
+    """Lowercased, accent-stripped title with collapsed whitespace."""
+
+    title = unicodedata.normalize("NFKD", indexed_doc.get("title") or "")
+    title = "".join(char for char in title if not unicodedata.combining(char))
+    return " ".join(title.lower().split())
+
+
+def summary_length(indexed_doc):
+    return len(indexed_doc.get("summary") or "")
+
+
+def reading_time(indexed_doc):
+    """Minutes needed to read content, rounded up."""
+
+    words = len((indexed_doc.get("content") or "").split())
+    return math.ceil(words / WORDS_PER_MINUTE)
+
+
+ENRICHMENTS = {
+    "title_normalized": {
+        "mapping": {"type": "keyword", "ignore_above": 256},
+        "compute": normalize_title,
+    },
+    "summary_length": {"mapping": {"type": "integer"}, "compute": summary_length},
+    "reading_time_minutes": {
+        "mapping": {"type": "integer"},
+        "compute": reading_time,
+    },
+}
+
+
+def split_passages(text, max_chars=PASSAGE_CHARS):
+    """
+    Split text into passages of at most max_chars, preferably ending on a
+    paragraph, then a sentence, then a word boundary. Each passage keeps the
+    character offset it starts at in text.
+    """
+
+    passages = []
+    start = 0
+
+    while start < len(text):
+        end = min(start + max_chars, len(text))
+        if end < len(text):
+            for separator in ("\n", ". ", " "):
+                cut = text.rfind(separator, start + max_chars // 2, end)
+                if cut != -1:
+                    end = cut + len(separator)
+                    break
+
+        chunk = text[start:end]
+        stripped = chunk.strip()
+        if stripped:
+            offset = start + len(chunk) - len(chunk.lstrip())
+            passages.append({"offset": offset, "text": stripped})
+        start = end
+
+    return passages
+
+
+PASSAGES = {
+    "mapping": {
+        "type": "nested",
+        "properties": {
+            "offset": {"type": "integer", "index": False},
+            # Offsets in the postings let the unified highlighter skip
+            # re-analyzing the passage text
+            "text": {
+                "type": "text",
+                "analyzer": "english",
+                "index_options": "offsets",
+            },
+        },
+    },
+    "compute": lambda indexed_doc: split_passages(indexed_doc.get("content") or ""),
+}
+
+
+def with_passages(source):
+    """source, additionally splitting content into a nested passages field."""
+
+    return {
+        **source,
+        "enrichments": {**source.get("enrichments", {}), "passages": PASSAGES},
+    }
+
+
+def fill_title_from_url(indexed_doc):
+    if not indexed_doc.get("title") and indexed_doc.get("url"):
+        indexed_doc["title"] = extract_title_from_url(indexed_doc["url"])
+
+
+SOURCES = {
+    "wikipedia": {
+        "fields": {
+            "url": {"mapping": {"type": "keyword"}, "default": ""},
+            "title": {"mapping": TITLE_TEXT, "default": ""},
+            "summary": {"mapping": ENGLISH_TEXT, "default": ""},
+            "content": {"mapping": ENGLISH_TEXT, "default": ""},
+            "categories": {"mapping": {"type": "keyword"}, "default": []},
+            "link_urls": {
+                "mapping": {"type": "keyword"},
+                "from": "internal_links",
+                "transform": link_field("url"),
+                "default": [],
+            },
+            "link_texts": {
+                "mapping": ENGLISH_TEXT,
+                "from": "internal_links",
+                "transform": link_field("text"),
+                "default": [],
+            },
+        },
+        "finalize": fill_title_from_url,
+        "enrichments": ENRICHMENTS,
+    },
+    "bbc": {
+        "fields": {
+            "url": {"mapping": {"type": "keyword"}, "default": ""},
+            "article_id": {"mapping": {"type": "keyword"}, "optional": True},
+            "title": {"mapping": TITLE_TEXT, "default": ""},
+            "author": {
+                "mapping": {
+                    "type": "text",
+                    "fields": {"raw": {"type": "keyword", "ignore_above": 256}},
+                },
+                "optional": True,
+            },
+            "published_at": {
+                "mapping": {"type": "date"},
+                "from": "timestamp",
+                "transform": to_date,
+                "optional": True,
+            },
+            "category": {"mapping": {"type": "keyword"}, "optional": True},
+            "summary": {"mapping": ENGLISH_TEXT, "default": ""},
+            "content": {"mapping": ENGLISH_TEXT, "default": ""},
+            # Returned with hits but never searched
+            "image_urls": {
+                "mapping": {"type": "keyword", "index": False, "doc_values": False},
+                "default": [],
+            },
+        },
+        "enrichments": ENRICHMENTS,
+    },
+}
+
+DEFAULT_SOURCE = "wikipedia"
+
+
+def get_source(name):
+    try:
+        return SOURCES[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown source {name!r}, expected one of: {', '.join(SOURCES)}"
+        )
+
+
+def source_projection(source):
+    """Mongo projection of the fields source reads."""
+
+    return {spec.get("from", field): 1 for field, spec in source["fields"].items()}
+
+
+def source_mapping(source):
+    """Index body (mappings and settings) for source."""
+
+    properties = {field: spec["mapping"] for field, spec in source["fields"].items()}
+    for field, spec in source.get("enrichments", {}).items():
+        properties[field] = spec["mapping"]
+    # Stored for skip-unchanged lookups only
+    properties["content_hash"] = {"type": "keyword", "index": False}
+
+    settings = dict(INDEX_SETTINGS)
+    if source.get("analysis"):
+        settings["analysis"] = source["analysis"]
+
+    return {"mappings": {"properties": properties}, "settings": {"index": settings}}
+
+
+def build_document(source, doc):
+    """Transform a Mongo document into the indexed fields declared by source."""
+
+    indexed_doc = {}
+
+    for field, spec in source["fields"].items():
+        value = decompress_value(doc.get(spec.get("from", field)))
+        if value is not None and "transform" in spec:
+            value = spec["transform"](value)
+
+        if value is None:
+            if spec.get("optional"):
+                continue
+            value = copy.copy(spec.get("default"))
+
+        indexed_doc[field] = value
+
+    if "finalize" in source:
+        source["finalize"](indexed_doc)
+
+    return enrich_document(source, indexed_doc)
+
+
+def enrich_document(source, indexed_doc):
+    """Add the source's computed fields to a transformed document."""
+
+    for field, spec in source.get("enrichments", {}).items():
+        indexed_doc[field] = spec["compute"](indexed_doc)
+
+    return indexed_doc
@@ -2,14 +2,31 @@ from elasticsearch import Elasticsearch
 import os
 import openai
 import json
+import time
+
+try:
+    # orjson is optional: faster (de)serialization of search requests and hits
+    from elasticsearch.serializer import OrjsonSerializer
+except ImportError:
+    OrjsonSerializer = None
+
+# Mappings only change when an index is rebuilt, so whether an index has
+# passages is looked up once per PASSAGES_CACHE_SECONDS: index -> (checked_at, mapped)
+PASSAGES_CACHE_SECONDS = 300
+passages_mapped = {}
 
 
 class BaseElastic:
 
     def __init__(self, logger):
 
+        serializers = {}
+        if OrjsonSerializer is not None:
+            serializers["application/json"] = OrjsonSerializer()
+
         self.es = Elasticsearch(
-            [os.environ.get("ELASTICSEARCH_URI", "http://elasticsearch:9200")]
+            [os.environ.get("ELASTICSEARCH_URI", "http://elasticsearch:9200")],
+            serializers=serializers,
         )
         self.logger = logger
         openai.api_key = os.environ.get("OPENAI_API_KEY")
@@ -38,6 +55,29 @@ class BaseElastic:
                 "link_related": [],
             }
 
+    def has_passages(self, index):
+        """
+        Whether index (or the indices behind the alias) maps the nested
+        passages field built by the indexer's --passages option
+        """
+
+        cached = passages_mapped.get(index)
+        if cached and time.monotonic() - cached[0] < PASSAGES_CACHE_SECONDS:
+            return cached[1]
+
+        try:
+            mappings = self.es.indices.get_mapping(index=index).body
+            mapped = any(
+                "passages" in mapping.get("mappings", {}).get("properties", {})
+                for mapping in mappings.values()
+            )
+        except Exception as e:
+            self.logger.warning(f"Could not read the mapping of {index}: {e}")
+            mapped = False
+
+        passages_mapped[index] = (time.monotonic(), mapped)
+        return mapped
+
     def process_elastic_response(self, search_results):
 
         raw_results = []
@@ -47,9 +87,21 @@ class BaseElastic:
             source = hit["_source"]
             highlight = hit.get("highlight", {})
 
+            # Highlighted content passage, when the index has passages
+            passage_hits = (
+                hit.get("inner_hits", {}).get("passages", {}).get("hits", {})
+            ).get("hits", [])
+            for passage_hit in passage_hits:
+                if "passages.text" in passage_hit.get("highlight", {}):
+                    highlight.setdefault(
+                        "passages", passage_hit["highlight"]["passages.text"]
+                    )
+
             # Get excerpt from highlights or summary
             if "summary" in highlight:
                 excerpt = "...".join(highlight["summary"])
+            elif "passages" in highlight:
+                excerpt = "...".join(highlight["passages"])
             elif "content" in highlight:
                 excerpt = "...".join(highlight["content"][:1])
             else:
@@ -98,3 +150,33 @@ class BaseElastic:
             return []
 
         return self.process_elastic_response(search_results)
+
+    def suggest_titles(self, prefix, index, size=10):
+        """
+        Search-as-you-type title suggestions, served from the precomputed
+        title.suggest shingle and edge n-gram subfields
+        """
+
+        search_body = {
+            "size": size,
+            "_source": ["title", "url"],
+            "query": {
+                "multi_match": {
+                    "query": prefix,
+                    "type": "bool_prefix",
+                    "fields": [
+                        "title.suggest",
+                        "title.suggest._2gram",
+                        "title.suggest._3gram",
+                    ],
+                }
+            },
+        }
+
+        try:
+            search_results = self.es.search(index=index, body=search_body)
+        except Exception as e:
+            self.logger.error(f"Error executing Elasticsearch suggest query: {e}")
+            return []
+
+        return [hit["_source"] for hit in search_results["hits"]["hits"]]
@@ -6,6 +6,9 @@ import logging
 
 logger = logging.getLogger("webserver")
 
+# Indexer schema to use for each spider's output
+SPIDER_SOURCES = {"bbc_spider": "bbc"}
+
 
 @shared_task
 def run_index_job(index_job_id):
@@ -28,6 +31,10 @@ def run_index_job(index_job_id):
                 "mongo_collection": index_job.mongodb_collection,
                 "elastic_index": index_job.elastic_index,
                 "batch_size": index_job.batch_size,
+                "source": SPIDER_SOURCES.get(
+                    index_job.crawl_job.spider_name, "wikipedia"
+                ),
+                "incremental": True,
             },
             timeout=30,  # Timeout for initial request
         )
@@ -89,8 +96,16 @@ def check_index_status(index_job_id, indexer_job_id):
                 index_job.error_message = data["error"]
             index_job.save()
 
+            progress = data.get("progress")
+            if progress:
+                logger.info(
+                    f"Index job {index_job_id} progress: {progress['processed']}/{progress['total']} processed, "
+                    f"{progress['failed']} failed, {progress['docs_per_sec']} docs/s, "
+                    f"ETA {progress['eta_seconds']}s, last batch at {progress['last_batch_at']}"
+                )
+
             # If the job is still running, schedule another check
-            if index_job.status in ["queued", "running"]:
+            if index_job.status in ["queued", "running", "cancelling"]:
                 check_index_status.apply_async(
                     args=[index_job_id, indexer_job_id],
                     countdown=30,  # Check again in 30 seconds
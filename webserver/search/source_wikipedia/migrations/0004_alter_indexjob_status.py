@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("source_wikipedia", "0003_crawljob_spider_name"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="indexjob",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("queued", "Queued"),
+                    ("running", "Running"),
+                    ("completed", "Completed"),
+                    ("failed", "Failed"),
+                    ("cancelling", "Cancelling"),
+                    ("cancelled", "Cancelled"),
+                ],
+                default="queued",
+                max_length=20,
+            ),
+        ),
+    ]
@@ -32,6 +32,8 @@ class IndexJob(models.Model):
         ("running", "Running"),
         ("completed", "Completed"),
         ("failed", "Failed"),
+        ("cancelling", "Cancelling"),
+        ("cancelled", "Cancelled"),
     )
 
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="queued")
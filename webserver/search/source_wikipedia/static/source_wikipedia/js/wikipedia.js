@@ -3,6 +3,9 @@ document.addEventListener('DOMContentLoaded', function() {
     const resultsContainer = document.querySelector('.wikipedia-results');
     const loadingSpinner = document.querySelector('.loading-spinner');
     const paginationControls = document.querySelector('.pagination-controls');
+    const searchInput = document.querySelector('input[name="query"]');
+    const suggestionList = document.getElementById('wiki-suggestions');
+    let suggestTimer = null;
 
     if (searchForm) {
         searchForm.addEventListener('submit', function(e) {
@@ -11,6 +14,38 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    if (searchInput && suggestionList) {
+        searchInput.setAttribute('list', 'wiki-suggestions');
+        searchInput.setAttribute('autocomplete', 'off');
+
+        searchInput.addEventListener('input', function() {
+            clearTimeout(suggestTimer);
+
+            const prefix = searchInput.value.trim();
+            if (prefix.length < 2) {
+                suggestionList.innerHTML = '';
+                return;
+            }
+
+            // Wait for a pause in typing before asking for suggestions
+            suggestTimer = setTimeout(() => {
+                fetch(`${suggestionList.dataset.url}?query=${encodeURIComponent(prefix)}`)
+                .then(response => response.json())
+                .then(data => {
+                    suggestionList.innerHTML = '';
+                    data.suggestions.forEach(suggestion => {
+                        const option = document.createElement('option');
+                        option.value = suggestion.title;
+                        suggestionList.appendChild(option);
+                    });
+                })
+                .catch(error => {
+                    console.log(`Error fetching suggestions: ${error.message}`);
+                });
+            }, 200);
+        });
+    }
+
     function performSearch(page) {
 
         const query = document.querySelector('input[name="query"]').value;
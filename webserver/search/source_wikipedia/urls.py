@@ -3,6 +3,7 @@ from . import views
 
 urlpatterns = [
     path("wiki_search/", views.wiki_search, name="wiki_search"),
+    path("wiki_suggest/", views.wiki_suggest, name="wiki_suggest"),
     path("wiki_crawl/", views.wiki_crawl, name="wiki_crawl"),
     path(
         "wiki_crawl_status/<int:job_id>/",
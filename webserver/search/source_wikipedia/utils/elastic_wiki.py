@@ -1,10 +1,61 @@
 import json
 from common_utils.elastic_agent import BaseElastic
 
+# The only fields process_elastic_response reads; content and its passages
+# copy are the bulk of each document and are left out of the hits
+RESULT_SOURCE_FIELDS = ["title", "url", "summary", "categories"]
+
 
 class WikipediaElastic(BaseElastic):
 
-    def generate_regular_search_body_wiki(self, query):
+    def with_passage_highlights(self, query, text):
+        """
+        Wrap query so the best matching content passage is highlighted
+        (inner hits on the nested passages field) instead of the whole content.
+        Does not change which documents match or their score.
+        """
+
+        return {
+            "bool": {
+                "must": [query],
+                "should": [
+                    {
+                        "nested": {
+                            "path": "passages",
+                            "query": {"match": {"passages.text": text}},
+                            "ignore_unmapped": True,
+                            "boost": 0,
+                            "inner_hits": {
+                                "size": 1,
+                                "_source": False,
+                                "highlight": {
+                                    "fields": {
+                                        "passages.text": {"number_of_fragments": 1}
+                                    }
+                                },
+                            },
+                        }
+                    }
+                ],
+            }
+        }
+
+    def with_content_highlights(self, search_body, text, index):
+        """
+        Highlight the best passage when index has passages, otherwise fall
+        back to highlighting the content field itself
+        """
+
+        if not self.has_passages(index):
+            search_body["highlight"]["fields"]["content"] = {}
+        elif text.strip():
+            search_body["query"] = self.with_passage_highlights(
+                search_body["query"], text
+            )
+
+        return search_body
+
+    def generate_regular_search_body_wiki(self, query, index="wikipedia"):
 
         search_body = {
             "query": {
@@ -24,11 +75,12 @@ class WikipediaElastic(BaseElastic):
                     ]
                 }
             },
-            "highlight": {"fields": {"summary": {}, "content": {}}},
+            "_source": RESULT_SOURCE_FIELDS,
+            "highlight": {"fields": {"summary": {}}},
             "size": 100,
         }
 
-        return search_body
+        return self.with_content_highlights(search_body, query, index)
 
     def generate_prompt_wiki(self, query):
 
@@ -78,7 +130,7 @@ class WikipediaElastic(BaseElastic):
 
         return prompt
 
-    def build_elasticsearch_query_wiki(self, entities):
+    def build_elasticsearch_query_wiki(self, entities, index="wikipedia"):
         """
         Build an Elasticsearch query using the extracted entities
         """
@@ -125,10 +177,16 @@ class WikipediaElastic(BaseElastic):
 
         search_body = {
             "query": query,
-            "highlight": {"fields": {"summary": {}, "content": {}}},
+            "_source": RESULT_SOURCE_FIELDS,
+            "highlight": {"fields": {"summary": {}}},
             "size": 100,
         }
 
+        highlight_text = " ".join(
+            entities.get("content_keywords") or [entities.get("title") or ""]
+        )
+        search_body = self.with_content_highlights(search_body, highlight_text, index)
+
         self.logger.info(
             f"Built Wiki Elasticsearch query: {json.dumps(search_body, indent=2)}"
         )
@@ -34,7 +34,7 @@ def wiki_search(request):
 
             prompt = es.generate_prompt_wiki(query)
             entities = es.extract_entities_with_openai(prompt)
-            search_body = es.build_elasticsearch_query_wiki(entities)
+            search_body = es.build_elasticsearch_query_wiki(entities, index="wikipedia")
 
             raw_results = es.query_specified_fields(
                 search_body=search_body, index="wikipedia"
@@ -77,6 +77,23 @@ def wiki_search(request):
     return render(request, "source_wikipedia/wikipedia_search.html", context)
 
 
+def wiki_suggest(request):
+    """Title suggestions for the search box, as JSON"""
+
+    prefix = request.GET.get("query", "").strip()
+    if not prefix:
+        return JsonResponse({"query": prefix, "suggestions": []})
+
+    cache_key = f"wiki_suggestions:{prefix}"
+    suggestions = cache.get(cache_key)
+    if suggestions is None:
+        es = WikipediaElastic(logger)
+        suggestions = es.suggest_titles(prefix, index="wikipedia")
+        cache.set(cache_key, suggestions, 300)
+
+    return JsonResponse({"query": prefix, "suggestions": suggestions})
+
+
 def wiki_crawl(request):
     if request.method == "POST":
         form = WikipediaCrawlForm(request.POST)